@@ -0,0 +1,181 @@
+"""Точка входа бота.
+
+    python app.py            # продакшн
+    python app.py --reload   # разработка: перезапуск при изменении файлов (watchdog)
+
+Тяжёлые модули импортируются внутри main(), MongoDB подключается при
+первом запросе, индексы создаются в фоне параллельно с первым опросом
+Telegram, после чего продолжаются прерванные рассылки. По SIGTERM/SIGINT
+бот перестаёт принимать апдейты и ждёт завершения уже начатых
+обработчиков и текущих пачек рассылок.
+"""
+import argparse
+import logging
+import signal
+import threading
+import time
+
+# Весь путь остановки от SIGTERM до выхода укладывается в SHUTDOWN_TIMEOUT,
+# чтобы успеть до SIGKILL (grace period контейнера обычно 10-30 с).
+# stop_polling() срабатывает, только когда вернётся текущий getUpdates,
+# поэтому long polling короткий.
+SHUTDOWN_TIMEOUT = 20
+POLL_TIMEOUT = 5
+RESTART_DELAY = 30
+
+logger = logging.getLogger("app")
+
+
+def _process_started_at():
+    """Время старта процесса, чтобы учесть и запуск интерпретатора"""
+    try:
+        import psutil
+        return psutil.Process().create_time()
+    except Exception:
+        return time.time()
+
+
+class App:
+    def __init__(self, bot, bot_module, started_at):
+        self.bot = bot
+        self.bot_module = bot_module
+        self.started_at = started_at
+        self.stopping = threading.Event()
+        self.deadline = None  # Момент, к которому остановка должна завершиться
+        self._first_update = threading.Event()
+
+    def measure_first_update(self):
+        """Оборачивает process_new_updates, чтобы замерить время до первого апдейта"""
+        import metrics
+        process_new_updates = self.bot.process_new_updates
+
+        def wrapper(updates):
+            if updates and not self._first_update.is_set():
+                self._first_update.set()
+                elapsed = time.time() - self.started_at
+                metrics.TIME_TO_FIRST_UPDATE.set(elapsed)
+                logger.info("Time to first update: %.3fs", elapsed)
+            return process_new_updates(updates)
+
+        self.bot.process_new_updates = wrapper
+
+    def warm_up(self):
+        """Создаёт индексы, открывает соединения с MongoDB и импортирует numpy в фоне"""
+        import database
+        import geo
+        # numpy импортируется лениво; пусть это случится здесь, а не в первом поиске
+        geo.numpy()
+        try:
+            started = time.perf_counter()
+            database.ensure_indexes()
+            database.users.find_one({}, {"_id": 1})
+            logger.info("MongoDB warm-up finished in %.3fs", time.perf_counter() - started)
+        except Exception as e:
+            logger.error("MongoDB warm-up failed: %s", e)
+
+    def resume_campaigns(self):
+        """Продолжает рассылки, прерванные остановкой или падением процесса"""
+        import campaigns
+        from config import ADMIN_ID
+        try:
+            campaigns.resume_all(self.bot, report_to=ADMIN_ID)
+        except Exception as e:
+            logger.error("Failed to resume campaigns: %s", e)
+
+    def warm_up_and_resume(self):
+        self.warm_up()
+        self.resume_campaigns()
+
+    def run(self, reload=False):
+        while not self.stopping.is_set():
+            try:
+                logger.info("Starting bot polling...")
+                self.bot.infinity_polling(
+                    timeout=POLL_TIMEOUT + 10,
+                    long_polling_timeout=POLL_TIMEOUT,
+                    restart_on_change=reload,
+                    skip_pending=True
+                )
+                break
+            except Exception as e:
+                logger.error("Bot crashed with error: %s", e)
+                logger.info("Restarting bot in %s seconds...", RESTART_DELAY)
+                self.stopping.wait(RESTART_DELAY)
+
+    def stop(self, *_):
+        if self.stopping.is_set():
+            return
+        logger.info("Stopping bot polling...")
+        self.deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        self.stopping.set()
+        self.bot.stop_polling()
+
+    def drain(self):
+        """Ждёт, пока пул обработает очередь и завершит начатые обработчики.
+
+        Апдейты из последнего getUpdates тоже обрабатываются, но ожидание
+        отсчитывается от сигнала, а не от выхода из опроса.
+        """
+        deadline = self.deadline or time.monotonic() + SHUTDOWN_TIMEOUT
+        pool = getattr(self.bot, "worker_pool", None)
+        tasks = getattr(pool, "tasks", None)
+        while tasks is not None and not tasks.empty() and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+        if self.bot_module.wait_for_handlers(max(0.0, deadline - time.monotonic())):
+            logger.info("All handlers finished")
+        else:
+            logger.warning("Handlers did not finish in %ss, shutting down anyway", SHUTDOWN_TIMEOUT)
+
+        import campaigns
+        if not campaigns.shutdown(max(0.0, deadline - time.monotonic())):
+            logger.warning("Campaigns did not stop in %ss, they will resume after restart", SHUTDOWN_TIMEOUT)
+        if pool is not None:
+            pool.close()
+
+
+def create_app(token=None, threaded=True, started_at=None):
+    """Собирает бота: импорт модулей, регистрация обработчиков, без обращения к сети"""
+    started_at = started_at or _process_started_at()
+    if token is None:
+        from config import TOKEN as token
+    import bot as bot_module
+    return App(bot_module.create_bot(token, threaded=threaded), bot_module, started_at)
+
+
+def main(argv=None):
+    started_at = _process_started_at()
+    parser = argparse.ArgumentParser(description="Запуск бота")
+    parser.add_argument("--reload", action="store_true", help="Перезапуск при изменении файлов (для разработки)")
+    parser.add_argument("--no-metrics", action="store_true", help="Не поднимать эндпоинт /metrics")
+    args = parser.parse_args(argv)
+
+    import logs
+    logs.setup_logging()
+    import metrics
+    import database
+
+    app = create_app(started_at=started_at)
+    app.measure_first_update()
+    threading.Thread(target=app.warm_up_and_resume, name="mongo-warm-up", daemon=True).start()
+
+    if not args.no_metrics:
+        metrics.serve()
+        logger.info("Метрики доступны на http://%s:%s/metrics", metrics.METRICS_HOST, metrics.METRICS_PORT)
+
+    signal.signal(signal.SIGTERM, app.stop)
+    signal.signal(signal.SIGINT, app.stop)
+
+    startup = time.time() - started_at
+    metrics.STARTUP_SECONDS.set(startup)
+    logger.info("Бот запущен за %.3fs", startup)
+    try:
+        app.run(reload=args.reload)
+    finally:
+        app.drain()
+        database.close()
+        logs.shutdown_logging()
+
+
+if __name__ == "__main__":
+    main()
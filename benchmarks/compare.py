@@ -0,0 +1,54 @@
+"""Сравнение двух прогонов бенчмарка.
+
+    python -m benchmarks.compare benchmarks/results/old.json benchmarks/results/new.json
+
+Возвращает код 1, если p50 или p99 какого-либо сценария выросли больше порога.
+"""
+import argparse
+import json
+import sys
+
+METRICS = ["p50_ms", "p99_ms", "throughput_per_s"]
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(baseline, candidate, threshold):
+    regressions = []
+    print(f"{'flow':>12} {'metric':>16} {baseline['commit']:>10} {candidate['commit']:>10} {'change':>8}")
+    for flow, old in baseline["flows"].items():
+        new = candidate["flows"].get(flow)
+        if new is None:
+            print(f"{flow:>12} отсутствует в {candidate['commit']}")
+            continue
+        for metric in METRICS:
+            change = (new[metric] - old[metric]) / old[metric] if old[metric] else 0.0
+            print(f"{flow:>12} {metric:>16} {old[metric]:10.2f} {new[metric]:10.2f} {change:+8.1%}")
+            # Для пропускной способности регрессия — это падение, для задержек — рост
+            worse = -change if metric == "throughput_per_s" else change
+            if worse > threshold:
+                regressions.append((flow, metric, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сравнение результатов бенчмарка")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Допустимое ухудшение, доля (0.1 = 10%%)")
+    args = parser.parse_args(argv)
+
+    regressions = compare(load(args.baseline), load(args.candidate), args.threshold)
+    if regressions:
+        print("\nРегрессии:")
+        for flow, metric, change in regressions:
+            print(f"  {flow} {metric}: {change:+.1%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
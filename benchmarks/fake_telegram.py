@@ -0,0 +1,58 @@
+import itertools
+import json
+import time
+from collections import Counter, deque
+
+from telebot import apihelper
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, result):
+        self._payload = {"ok": True, "result": result}
+        self.text = json.dumps(self._payload)
+
+    def json(self):
+        return self._payload
+
+
+class FakeTelegramApi:
+    """Подменяет HTTP-транспорт telebot и записывает исходящие вызовы API"""
+
+    def __init__(self, keep_last=1000):
+        self.counts = Counter()
+        self.calls = deque(maxlen=keep_last)
+        self._message_ids = itertools.count(1)
+        self._previous_sender = None
+
+    def install(self):
+        self._previous_sender = apihelper.CUSTOM_REQUEST_SENDER
+        apihelper.CUSTOM_REQUEST_SENDER = self
+        return self
+
+    def uninstall(self):
+        apihelper.CUSTOM_REQUEST_SENDER = self._previous_sender
+
+    def reset(self):
+        self.counts.clear()
+        self.calls.clear()
+
+    def __call__(self, http_method, url, params=None, files=None, **kwargs):
+        method = url.rsplit("/", 1)[-1]
+        params = params or {}
+        self.counts[method] += 1
+        self.calls.append((method, params))
+        return FakeResponse(self._result(method, params))
+
+    def _result(self, method, params):
+        chat_id = int(params.get("chat_id", 0))
+        if method in ("answerCallbackQuery", "deleteMessage"):
+            return True
+        if method == "getChat":
+            return {"id": chat_id, "type": "private", "username": f"bench_user_{chat_id}"}
+        return {
+            "message_id": int(params.get("message_id", 0)) or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
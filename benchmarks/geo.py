@@ -0,0 +1,77 @@
+"""Проверка точности и скорости geo относительно utils.calculate_distance.
+
+    python -m benchmarks.geo --points 100000
+"""
+import argparse
+import random
+import time
+
+import geo
+from benchmarks.population import CITIES, CITY_SPREAD
+from utils import calculate_distance
+
+
+def _timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def random_points(rng, count):
+    """Точки вокруг городов популяции плюс равномерно по всему шару"""
+    points = []
+    for i in range(count):
+        if i % 4 == 0:
+            points.append(geo.Coordinates(rng.uniform(-89, 89), rng.uniform(-180, 180)))
+        else:
+            lat, lon, _ = rng.choice(CITIES)
+            points.append(geo.Coordinates(rng.gauss(lat, CITY_SPREAD), rng.gauss(lon, CITY_SPREAD)))
+    return points
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Точность и скорость модуля geo")
+    parser.add_argument("--points", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    origin = geo.Coordinates(*CITIES[0][:2])
+    points = random_points(rng, args.points)
+    lats = [p.lat for p in points]
+    lons = [p.lon for p in points]
+
+    # Импорт numpy не входит в замер пакетного расчёта
+    geo.numpy()
+    reference, reference_time = _timed(lambda: [calculate_distance(origin, p) for p in points])
+    scalar, scalar_time = _timed(lambda: [geo.haversine(origin, p) for p in points])
+    fast, fast_time = _timed(lambda: [geo.distance(origin, p) for p in points])
+    batch, batch_time = _timed(lambda: geo.distances(origin, lats, lons))
+
+    def max_error(values, only_near=False):
+        worst_abs = worst_rel = 0.0
+        for ref, value, point in zip(reference, values, points):
+            if only_near and not (abs(point.lat - origin.lat) < geo.FAST_PATH_MAX_DEGREES
+                                  and abs(point.lon - origin.lon) < geo.FAST_PATH_MAX_DEGREES):
+                continue
+            worst_abs = max(worst_abs, abs(float(value) - ref))
+            if ref > 0.001:
+                worst_rel = max(worst_rel, abs(float(value) - ref) / ref)
+        return worst_abs, worst_rel
+
+    print(f"numpy: {'да' if geo.numpy() is not None else 'нет'}, точек: {args.points}")
+    print(f"{'реализация':>28} {'время, мс':>10} {'ускорение':>10} {'макс. ошибка, км':>17} {'отн. ошибка':>12}")
+    rows = [
+        ("utils.calculate_distance", reference_time, reference, False),
+        ("geo.haversine", scalar_time, scalar, False),
+        ("geo.distance (быстрый путь)", fast_time, fast, True),
+        ("geo.distances (пакет)", batch_time, batch, False),
+    ]
+    for name, elapsed, values, only_near in rows:
+        worst_abs, worst_rel = max_error(values, only_near)
+        print(f"{name:>28} {elapsed * 1000:10.1f} {reference_time / elapsed:9.1f}x "
+              f"{worst_abs:17.6f} {worst_rel:12.2e}")
+
+
+if __name__ == "__main__":
+    main()
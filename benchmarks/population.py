@@ -0,0 +1,135 @@
+import random
+from datetime import datetime, timedelta
+
+from keyboards import HOBBIES
+
+FIRST_USER_ID = 1_000_000_000
+
+# Города с весами примерно по численности населения: (широта, долгота, вес)
+CITIES = [
+    (55.7558, 37.6173, 0.40),  # Москва
+    (59.9343, 30.3351, 0.20),  # Санкт-Петербург
+    (55.0084, 82.9357, 0.10),  # Новосибирск
+    (56.8389, 60.6057, 0.10),  # Екатеринбург
+    (55.7963, 49.1088, 0.08),  # Казань
+    (56.3269, 44.0059, 0.07),  # Нижний Новгород
+    (45.0355, 38.9753, 0.05),  # Краснодар
+]
+CITY_SPREAD = 0.15  # Стандартное отклонение координат вокруг центра города, градусы
+
+# Популярность увлечений убывает по закону Ципфа
+HOBBY_WEIGHTS = [1 / (rank + 1) for rank in range(len(HOBBIES))]
+
+MALE_NAMES = ["Алексей", "Дмитрий", "Иван", "Максим", "Сергей", "Артём", "Никита", "Павел"]
+FEMALE_NAMES = ["Анна", "Мария", "Елена", "Ольга", "Дарья", "Алина", "Ксения", "Полина"]
+BIOS = [
+    "Люблю долгие прогулки и хорошие книги.",
+    "Ищу человека для путешествий и разговоров до утра.",
+    "Пишу код, по выходным катаюсь на велосипеде.",
+    "Обожаю готовить и пробовать новую кухню.",
+    "Хожу в зал, слушаю джаз, завела собаку.",
+]
+SUSPICIOUS_BIO = "Пишите в личку, подробности на www.example.com"
+
+
+def _age(rng):
+    """Возраст со сдвигом к 22-35 годам, в пределах 18-99"""
+    return max(18, min(99, int(rng.gauss(29, 7))))
+
+
+def _hobbies(rng):
+    count = rng.randint(2, 6)
+    chosen = set()
+    while len(chosen) < count:
+        chosen.add(rng.choices(HOBBIES, weights=HOBBY_WEIGHTS)[0])
+    return list(chosen)
+
+
+def _location(rng):
+    lat, lon, _ = rng.choices(CITIES, weights=[c[2] for c in CITIES])[0]
+    return {
+        "latitude": round(rng.gauss(lat, CITY_SPREAD), 6),
+        "longitude": round(rng.gauss(lon, CITY_SPREAD), 6)
+    }
+
+
+def _last_active(rng, now, registered_at):
+    """Большинство анкет спящие: 20% заходили за неделю, 20% за месяц"""
+    roll = rng.random()
+    if roll < 0.2:
+        days = rng.uniform(0, 7)
+    elif roll < 0.4:
+        days = rng.uniform(7, 30)
+    else:
+        days = rng.uniform(30, 365)
+    return max(registered_at, now - timedelta(days=days))
+
+
+def generate_user(rng, user_id, now):
+    gender = "Мужчина" if rng.random() < 0.52 else "Женщина"
+    roll = rng.random()
+    if roll < 0.1:
+        looking_for = "Не важно"
+    elif roll < 0.95:
+        looking_for = "Женщину" if gender == "Мужчина" else "Мужчину"
+    else:
+        looking_for = "Мужчину" if gender == "Мужчина" else "Женщину"
+
+    verified = rng.random() < 0.3
+    registered_at = now - timedelta(days=rng.randint(0, 365))
+    user = {
+        "_id": user_id,
+        "gender": gender,
+        "name": rng.choice(MALE_NAMES if gender == "Мужчина" else FEMALE_NAMES),
+        "looking_for": looking_for,
+        "photo": f"bench-photo-{user_id}",
+        "age": _age(rng),
+        "height": rng.randint(150, 200),
+        "bio": SUSPICIOUS_BIO if rng.random() < 0.01 else rng.choice(BIOS),
+        "hobbies": _hobbies(rng),
+        "location": _location(rng),
+        "verified": verified,
+        "username": f"bench_user_{user_id}",
+        "registered_at": registered_at,
+        "last_active": _last_active(rng, now, registered_at),
+        "liked": [],
+        "liked_by": [],
+        "viewed": [],
+        "reports": 0,
+        "banned": rng.random() < 0.01,
+    }
+    if verified:
+        user["phone"] = f"+7900{user_id % 10_000_000:07d}"
+    if rng.random() < 0.03:
+        user["deleted"] = True
+        user["deleted_at"] = now - timedelta(days=rng.randint(0, 90))
+    return user
+
+
+def generate_population(size, seed=42, likes_per_user=5, viewed_per_user=20):
+    """Генерирует детерминированную популяцию анкет вместе с графом лайков и просмотров"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    population = [generate_user(rng, FIRST_USER_ID + i, now) for i in range(size)]
+
+    ids = [user["_id"] for user in population]
+    by_id = {user["_id"]: user for user in population}
+    for user in population:
+        for target_id in rng.sample(ids, min(likes_per_user, size)):
+            if target_id != user["_id"] and target_id not in user["liked"]:
+                user["liked"].append(target_id)
+                by_id[target_id]["liked_by"].append(user["_id"])
+        user["viewed"] = rng.sample(ids, min(viewed_per_user, size))
+        if user["viewed"]:
+            user["last_viewed"] = now - timedelta(hours=rng.randint(0, 48))
+
+    return population
+
+
+def load_population(collection, size, seed=42, batch_size=1000):
+    """Очищает коллекцию и заливает в неё синтетическую популяцию"""
+    collection.delete_many({})
+    population = generate_population(size, seed)
+    for i in range(0, len(population), batch_size):
+        collection.insert_many(population[i:i + batch_size])
+    return population
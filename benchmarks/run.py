@@ -0,0 +1,278 @@
+"""Бенчмарк основных сценариев бота на синтетической популяции.
+
+Запуск из корня репозитория:
+    python -m benchmarks.run --users 10000
+    python -m benchmarks.run --backend mongod --mongo-uri mongodb://localhost:27017/
+
+Результаты пишутся в benchmarks/results/<commit>-<время>.json,
+сравнить два прогона: python -m benchmarks.compare old.json new.json
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import types as module_types
+from datetime import datetime
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+BENCH_TOKEN = "123456789:BENCHMARK-TOKEN"
+BENCH_DB = "dating_bot_bench"
+BENCH_COLLECTIONS = ["users", "old_profiles", "archived_profiles", "jobs"]
+
+
+def install_config():
+    """Подставляет конфиг с фиктивным токеном, чтобы не трогать настоящий бот"""
+    config = module_types.ModuleType("config")
+    config.TOKEN = BENCH_TOKEN
+    config.AGREEMENT_URL = "https://example.com/agreement"
+    config.PRIVACY_URL = "https://example.com/privacy"
+    config.ADMIN_ID = 1
+    sys.modules["config"] = config
+
+
+def connect(backend, mongo_uri):
+    """Возвращает базу выбранного бэкенда"""
+    if backend == "mongomock":
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("mongomock is not installed: pip install -r benchmarks/requirements.txt")
+        db = mongomock.MongoClient()[BENCH_DB]
+    else:
+        from pymongo import MongoClient
+        db = MongoClient(mongo_uri)[BENCH_DB]
+    return db
+
+
+def load_bot(db):
+    """Импортирует bot.py с подменёнными коллекциями и синхронной обработкой апдейтов"""
+    install_config()
+    import database
+    for name in BENCH_COLLECTIONS:
+        setattr(database, name, database.instrument(db[name], name))
+    database.ensure_indexes()
+
+    import bot as bot_module
+    bot_module.create_bot(BENCH_TOKEN, threaded=False)
+    bot_module.REQUEST_COOLDOWN = 0
+    return bot_module
+
+
+class UpdateFactory:
+    """Собирает объекты Update так, как их прислал бы Telegram"""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+
+    def _user(self, chat_id):
+        return {"id": chat_id, "is_bot": False, "first_name": f"Bench{chat_id}", "username": f"bench_{chat_id}"}
+
+    def _message(self, chat_id, **content):
+        message = {
+            "message_id": next(self._ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": self._user(chat_id),
+        }
+        message.update(content)
+        return message
+
+    def text(self, chat_id, text):
+        from telebot import types
+        content = {"text": text}
+        if text.startswith("/"):
+            content["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+        return types.Update.de_json({"update_id": next(self._ids), "message": self._message(chat_id, **content)})
+
+    def photo(self, chat_id):
+        from telebot import types
+        photo = [{"file_id": f"bench-photo-{chat_id}", "file_unique_id": f"u{chat_id}", "width": 800, "height": 800}]
+        return types.Update.de_json({"update_id": next(self._ids), "message": self._message(chat_id, photo=photo)})
+
+    def location(self, chat_id, latitude, longitude):
+        from telebot import types
+        location = {"latitude": latitude, "longitude": longitude}
+        return types.Update.de_json({"update_id": next(self._ids), "message": self._message(chat_id, location=location)})
+
+    def callback(self, chat_id, data):
+        from telebot import types
+        return types.Update.de_json({
+            "update_id": next(self._ids),
+            "callback_query": {
+                "id": str(next(self._ids)),
+                "from": self._user(chat_id),
+                "chat_instance": str(chat_id),
+                "data": data,
+                "message": self._message(chat_id, text="bench"),
+            }
+        })
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.elapsed = {}
+
+    def measure(self, flow, bot, updates):
+        start = time.perf_counter()
+        for update in updates:
+            bot.process_new_updates([update])
+        duration = time.perf_counter() - start
+        self.samples.setdefault(flow, []).append(duration)
+        self.elapsed[flow] = self.elapsed.get(flow, 0.0) + duration
+
+    def summary(self):
+        result = {}
+        for flow, samples in self.samples.items():
+            ordered = sorted(samples)
+            result[flow] = {
+                "count": len(ordered),
+                "p50_ms": _percentile(ordered, 50) * 1000,
+                "p99_ms": _percentile(ordered, 99) * 1000,
+                "mean_ms": statistics.fmean(ordered) * 1000,
+                "throughput_per_s": len(ordered) / self.elapsed[flow] if self.elapsed[flow] else 0.0,
+            }
+        return result
+
+
+def _percentile(ordered, percent):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_registration(bot_module, factory, recorder, rng, count, first_id):
+    import callbacks
+    from keyboards import GENDERS, TARGETS, HOBBIES
+    from benchmarks.population import CITIES
+
+    for chat_id in range(first_id, first_id + count):
+        lat, lon, _ = rng.choice(CITIES)
+        hobby_indexes = rng.sample(range(len(HOBBIES)), 3)
+        updates = [
+            factory.text(chat_id, "/start"),
+            factory.text(chat_id, rng.choice(GENDERS)),
+            factory.text(chat_id, "Бенчмарк"),
+            factory.text(chat_id, rng.choice(TARGETS)),
+            factory.photo(chat_id),
+            factory.text(chat_id, str(rng.randint(18, 45))),
+            factory.text(chat_id, str(rng.randint(150, 200))),
+            factory.text(chat_id, "Люблю бенчмарки и горы."),
+        ]
+        updates += [factory.callback(chat_id, callbacks.encode(callbacks.HOBBY, i)) for i in hobby_indexes]
+        updates += [
+            factory.callback(chat_id, callbacks.encode(callbacks.HOBBIES_DONE)),
+            factory.location(chat_id, lat, lon),
+            factory.text(chat_id, "🚫 Пропустить верификацию"),
+        ]
+        recorder.measure("registration", bot_module.bot, updates)
+
+
+def current_profile(bot_module, chat_id):
+    state = bot_module.user_data.get(chat_id, {})
+    results = state.get("search_results", [])
+    index = state.get("current_index", 0)
+    return results[index] if index < len(results) else None
+
+
+def run_sessions(bot_module, factory, recorder, searchers, swipes, likes):
+    import callbacks
+
+    for chat_id in searchers:
+        recorder.measure("search", bot_module.bot, [factory.text(chat_id, "🔍 Начать поиск")])
+
+        for _ in range(swipes):
+            profile_id = current_profile(bot_module, chat_id)
+            if profile_id is None:
+                break
+            data = callbacks.encode(callbacks.DISLIKE, profile_id, chat_id)
+            recorder.measure("swipe", bot_module.bot, [factory.callback(chat_id, data)])
+
+        for _ in range(likes):
+            profile_id = current_profile(bot_module, chat_id)
+            if profile_id is None:
+                break
+            data = callbacks.encode(callbacks.LIKE, profile_id, chat_id)
+            recorder.measure("like", bot_module.bot, [factory.callback(chat_id, data)])
+
+        recorder.measure("matches", bot_module.bot, [factory.text(chat_id, "❤️ Мои совпадения")])
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк сценариев бота")
+    parser.add_argument("--users", type=int, default=10000, help="Размер синтетической популяции")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--backend", choices=["mongomock", "mongod"], default="mongomock")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/")
+    parser.add_argument("--registrations", type=int, default=200)
+    parser.add_argument("--searches", type=int, default=200)
+    parser.add_argument("--swipes", type=int, default=10, help="Дизлайков на одну сессию поиска")
+    parser.add_argument("--likes", type=int, default=3, help="Лайков на одну сессию поиска")
+    parser.add_argument("--output", help="Путь к JSON с результатами")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rng = random.Random(args.seed)
+
+    from benchmarks.fake_telegram import FakeTelegramApi
+    from benchmarks.population import FIRST_USER_ID, load_population
+
+    db = connect(args.backend, args.mongo_uri)
+    for name in BENCH_COLLECTIONS:
+        db[name].delete_many({})
+    population = load_population(db.users, args.users, args.seed)
+
+    bot_module = load_bot(db)
+    api = FakeTelegramApi().install()
+    factory = UpdateFactory()
+    recorder = Recorder()
+
+    try:
+        run_registration(bot_module, factory, recorder, rng, args.registrations, FIRST_USER_ID + args.users)
+        active = [u["_id"] for u in population if not u.get("deleted") and not u.get("banned")]
+        searchers = rng.sample(active, min(args.searches, len(active)))
+        run_sessions(bot_module, factory, recorder, searchers, args.swipes, args.likes)
+    finally:
+        api.uninstall()
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "backend": args.backend,
+        "params": vars(args),
+        "flows": recorder.summary(),
+        "telegram_calls": dict(api.counts),
+    }
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{commit}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for flow, stats in report["flows"].items():
+        print(f"{flow:>12}: n={stats['count']:<6} p50={stats['p50_ms']:8.2f}ms "
+              f"p99={stats['p99_ms']:8.2f}ms  {stats['throughput_per_s']:8.1f}/s")
+    print(f"Результаты сохранены в {output}")
+
+
+if __name__ == "__main__":
+    main()
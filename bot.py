@@ -1,38 +1,102 @@
-import telebot
-from telebot import types
-from config import TOKEN, AGREEMENT_URL, PRIVACY_URL, ADMIN_ID
 from database import users, old_profiles
-from utils import calculate_distance
+import campaigns
+import compaction
+import callbacks
+import geo
+import keyboards
+import logs
+import metrics
+from keyboards import GENDERS, TARGETS, HOBBIES
 from datetime import datetime, timedelta
 import time
 import logging
+import threading
+import functools
 from collections import defaultdict
 
 # Константы
 MAX_AGE_DIFFERENCE = 10  # Максимальная разница в возрасте
 MIN_HOBBY_MATCH = 0.3  # Минимальное совпадение интересов (0-1)
 REQUEST_COOLDOWN = 1  # Секунды между запросами от одного пользователя
+ACTIVITY_WRITE_INTERVAL = 15 * 60  # Секунды между записями last_active одного пользователя
+HOT_TIER_DAYS = 7  # Заходил за последнюю неделю
+WARM_TIER_DAYS = 30  # Заходил за последний месяц, остальные - холодный слой
+SEARCH_RESULTS_LIMIT = 50  # Анкет в одной выдаче
+RECENCY_WEIGHT = 5  # Вес недавней активности в рейтинге
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
+logger.addFilter(metrics.HandledErrorCounter())
 
-bot = telebot.TeleBot(TOKEN, threaded=True, num_threads=4)
+# Бот создаётся в create_bot(); при импорте модуля обработчики только
+# собираются в список, без сети, Mongo, config и конструирования TeleBot
+bot = None
 user_data = {}
 user_last_request = defaultdict(float)
+user_last_active_write = defaultdict(float)
 
-GENDERS = ["Мужчина", "Женщина"]
-TARGETS = ["Мужчину", "Женщину", "Не важно"]
-HOBBIES = [
-    "🎵 Музыка", "🎮 Игры", "📚 Чтение", "🏃 Спорт", "🎨 Искусство",
-    "🍳 Кулинария", "✈️ Путешествия", "🎥 Кино", "🐶 Животные",
-    "💻 Программирование", "🌳 Природа", "🏋️ Фитнес", "📷 Фото"
+TELEGRAM_METHODS = [
+    "send_message", "send_photo", "answer_callback_query",
+    "edit_message_text", "edit_message_reply_markup", "get_chat"
 ]
+
 BANNED_WORDS = ["http", "www", ".com", "куплю", "продам", "деньги", "работа"]
 
+_handlers = []  # (тип, функция, фильтры) в порядке объявления
+_in_flight = 0
+_in_flight_done = threading.Condition()
+
+def on_message(**filters):
+    """Регистрирует обработчик сообщений; в TeleBot он попадёт в create_bot()"""
+    def decorator(handler):
+        _handlers.append(("message", handler, filters))
+        return handler
+    return decorator
+
+def on_callback(**filters):
+    """Регистрирует обработчик нажатий инлайн-кнопок"""
+    def decorator(handler):
+        _handlers.append(("callback_query", handler, filters))
+        return handler
+    return decorator
+
+def create_bot(token, threaded=True, num_threads=4):
+    """Создаёт TeleBot и подключает к нему все обработчики модуля"""
+    global bot
+    import telebot
+
+    bot = telebot.TeleBot(token, threaded=threaded, num_threads=num_threads)
+    callbacks.set_secret(token)
+    for kind, handler, filters in _handlers:
+        # Через декоратор, а не register_*_handler: у них разные умолчания content_types
+        getattr(bot, f"{kind}_handler")(**filters)(handler)
+
+    metrics.instrument_methods(bot, TELEGRAM_METHODS, metrics.TELEGRAM_LATENCY, errors=metrics.TELEGRAM_ERRORS)
+    metrics.track_state(user_data, user_last_request, bot)
+    return bot
+
+def _track_in_flight(handler):
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        global _in_flight
+        with _in_flight_done:
+            _in_flight += 1
+        try:
+            return handler(*args, **kwargs)
+        finally:
+            with _in_flight_done:
+                _in_flight -= 1
+                _in_flight_done.notify_all()
+    return wrapper
+
+def wait_for_handlers(timeout):
+    """Ждёт завершения выполняющихся обработчиков; True, если дождались"""
+    with _in_flight_done:
+        return _in_flight_done.wait_for(lambda: _in_flight == 0, timeout)
+
+def instrumented(handler):
+    """Метрики, контекст логов (chat_id, имя обработчика) и учёт выполняющихся обработчиков"""
+    return _track_in_flight(metrics.instrumented(logs.contextual(handler)))
+
 def safe_bot_send_message(chat_id, text, **kwargs):
     """Безопасная отправка сообщения с обработкой ошибок"""
     max_retries = 3
@@ -40,11 +104,13 @@ def safe_bot_send_message(chat_id, text, **kwargs):
         try:
             return bot.send_message(chat_id, text, **kwargs)
         except Exception as e:
-            logger.error(f"Attempt {attempt + 1} failed for {chat_id}: {str(e)}")
+            logger.error("Attempt %s failed for %s: %s", attempt + 1, chat_id, e)
             if attempt < max_retries - 1:
+                metrics.SEND_RETRIES.inc()
                 time.sleep(2 ** attempt)
             else:
-                logger.error(f"Failed to send message to {chat_id} after {max_retries} attempts")
+                metrics.SEND_FAILURES.inc()
+                logger.error("Failed to send message to %s after %s attempts", chat_id, max_retries)
                 return None
 
 def validate_profile(profile):
@@ -55,18 +121,13 @@ def validate_profile(profile):
     ]
     return all(field in profile and profile[field] for field in required_fields)
 
-def get_user_location(user):
-    """Получаем координаты пользователя в правильном формате"""
-    loc = user.get("location", {})
-    if not loc:
-        return None
+def find_profile(chat_id):
+    """Анкета пользователя; неактивные анкеты возвращаются из архива"""
+    return users.find_one({"_id": chat_id}) or compaction.restore_profile(chat_id)
 
-    try:
-        lat = float(loc.get("latitude", 0))
-        lon = float(loc.get("longitude", 0))
-        return (lat, lon)
-    except (TypeError, ValueError):
-        return None
+def get_user_location(user):
+    """Получаем проверенные координаты пользователя или None"""
+    return geo.Coordinates.from_location(user.get("location"))
 
 def check_suspicious_profile(profile):
     """Проверяет профиль на подозрительные признаки"""
@@ -108,19 +169,37 @@ def rate_limit_check(chat_id):
         safe_bot_send_message(chat_id, "Пожалуйста, не так быстро! Подождите немного.")
         return False
     user_last_request[chat_id] = current_time
+    touch_activity(chat_id, current_time)
     return True
 
-@bot.message_handler(commands=['start'])
+def touch_activity(chat_id, current_time):
+    """Обновляет last_active, но не чаще раза в ACTIVITY_WRITE_INTERVAL"""
+    if current_time - user_last_active_write[chat_id] < ACTIVITY_WRITE_INTERVAL:
+        return
+    user_last_active_write[chat_id] = current_time
+    try:
+        # Написавший боту снова доступен для рассылок
+        result = users.update_one(
+            {"_id": chat_id},
+            {"$set": {"last_active": datetime.fromtimestamp(current_time)}, "$unset": {"blocked_bot": ""}}
+        )
+        if result.matched_count == 0:
+            # Анкета могла уйти в архив за неактивность — возвращаем её при первом же действии
+            compaction.restore_profile(chat_id)
+    except Exception as e:
+        logger.error("Error updating last_active for %s: %s", chat_id, e)
+
+@on_message(commands=['start'])
+@instrumented
 def start(msg):
     if not rate_limit_check(msg.chat.id):
         return
 
     user_data[msg.chat.id] = {}
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.add(*GENDERS)
-    safe_bot_send_message(msg.chat.id, "Привет! Ваш пол?", reply_markup=markup)
+    safe_bot_send_message(msg.chat.id, "Привет! Ваш пол?", reply_markup=keyboards.get("genders"))
 
-@bot.message_handler(func=lambda m: m.text in GENDERS)
+@on_message(func=lambda m: m.text in GENDERS)
+@instrumented
 def ask_name(msg):
     if not rate_limit_check(msg.chat.id):
         return
@@ -128,11 +207,11 @@ def ask_name(msg):
     if msg.chat.id not in user_data:
         user_data[msg.chat.id] = {}
     user_data[msg.chat.id]["gender"] = msg.text
-    markup = types.ReplyKeyboardRemove()
-    safe_bot_send_message(msg.chat.id, "Как вас зовут?", reply_markup=markup)
+    safe_bot_send_message(msg.chat.id, "Как вас зовут?", reply_markup=keyboards.get("remove"))
 
-@bot.message_handler(
+@on_message(
     func=lambda m: "gender" in user_data.get(m.chat.id, {}) and "name" not in user_data.get(m.chat.id, {}))
+@instrumented
 def save_name_and_ask_target(msg):
     if not rate_limit_check(msg.chat.id):
         return
@@ -142,11 +221,10 @@ def save_name_and_ask_target(msg):
         return
 
     user_data[msg.chat.id]["name"] = msg.text.strip()
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.add(*TARGETS)
-    safe_bot_send_message(msg.chat.id, f"{msg.text.strip()}, кого вы ищете?", reply_markup=markup)
+    safe_bot_send_message(msg.chat.id, f"{msg.text.strip()}, кого вы ищете?", reply_markup=keyboards.get("targets"))
 
-@bot.message_handler(func=lambda m: m.text in TARGETS)
+@on_message(func=lambda m: m.text in TARGETS)
+@instrumented
 def ask_photo(msg):
     if not rate_limit_check(msg.chat.id):
         return
@@ -154,7 +232,8 @@ def ask_photo(msg):
     user_data[msg.chat.id]["looking_for"] = msg.text
     safe_bot_send_message(msg.chat.id, "Пожалуйста, отправьте своё фото")
 
-@bot.message_handler(content_types=['photo'])
+@on_message(content_types=['photo'])
+@instrumented
 def ask_age(msg):
     if not rate_limit_check(msg.chat.id):
         return
@@ -169,7 +248,8 @@ def ask_age(msg):
     user_data[msg.chat.id]["photo"] = photo_id
     safe_bot_send_message(msg.chat.id, "Сколько вам лет? (от 18 до 99)")
 
-@bot.message_handler(func=lambda m: m.text.isdigit() and 18 <= int(m.text) <= 99)
+@on_message(func=lambda m: m.text.isdigit() and 18 <= int(m.text) <= 99)
+@instrumented
 def ask_height(msg):
     if not rate_limit_check(msg.chat.id):
         return
@@ -177,7 +257,8 @@ def ask_height(msg):
     user_data[msg.chat.id]["age"] = int(msg.text)
     safe_bot_send_message(msg.chat.id, "Ваш рост в см?")
 
-@bot.message_handler(func=lambda m: m.text.isdigit() and 100 <= int(m.text) <= 250)
+@on_message(func=lambda m: m.text.isdigit() and 100 <= int(m.text) <= 250)
+@instrumented
 def ask_bio(msg):
     if not rate_limit_check(msg.chat.id):
         return
@@ -185,8 +266,9 @@ def ask_bio(msg):
     user_data[msg.chat.id]["height"] = int(msg.text)
     safe_bot_send_message(msg.chat.id, "Расскажите о себе:")
 
-@bot.message_handler(
+@on_message(
     func=lambda m: "height" in user_data.get(m.chat.id, {}) and "bio" not in user_data.get(m.chat.id, {}))
+@instrumented
 def save_bio_and_ask_hobbies(msg):
     if not rate_limit_check(msg.chat.id):
         return
@@ -194,52 +276,72 @@ def save_bio_and_ask_hobbies(msg):
     user_data[msg.chat.id]["bio"] = msg.text
     ask_hobbies(msg.chat.id)
 
-def ask_hobbies(chat_id):
-    markup = types.ReplyKeyboardMarkup(row_width=2, resize_keyboard=True)
-    buttons = [types.KeyboardButton(h) for h in HOBBIES]
-    markup.add(*buttons)
-    markup.add(types.KeyboardButton("✅ Готово"))
-
-    selected_hobbies = user_data.get(chat_id, {}).get("hobbies", [])
-    text = (
+def hobbies_text(selected_hobbies):
+    return (
             "Выберите увлечения (можно несколько):\n\n" +
             "Выбрано: " + (", ".join(selected_hobbies) if selected_hobbies else "пока ничего") +
             "\n\nНажимайте по одному, затем '✅ Готово'"
     )
 
-    safe_bot_send_message(chat_id, text, reply_markup=markup)
+def ask_hobbies(chat_id):
+    selected_hobbies = user_data.get(chat_id, {}).get("hobbies", [])
+    safe_bot_send_message(
+        chat_id,
+        hobbies_text(selected_hobbies),
+        reply_markup=keyboards.hobbies_markup(selected_hobbies)
+    )
 
-@bot.message_handler(func=lambda m: m.text in HOBBIES and ("height" in user_data.get(m.chat.id, {}) or user_data.get(m.chat.id, {}).get("editing")))
-def handle_hobby_selection(msg):
-    if not rate_limit_check(msg.chat.id):
+def is_choosing_hobbies(chat_id):
+    state = user_data.get(chat_id, {})
+    return "height" in state or state.get("editing")
+
+@instrumented
+def handle_hobby_selection(call, hobby_index):
+    chat_id = call.message.chat.id
+    if not is_choosing_hobbies(chat_id):
+        bot.answer_callback_query(call.id)
+        return
+
+    # Значение кнопки увлечения не подписано, поэтому проверяем диапазон
+    if not 0 <= hobby_index < len(HOBBIES):
+        logger.warning("Rejected hobby index %s from %s", hobby_index, chat_id)
+        bot.answer_callback_query(call.id, "Кнопка устарела. Выберите увлечения заново.")
         return
 
-    chat_id = msg.chat.id
+    hobby = HOBBIES[hobby_index]
     if "hobbies" not in user_data[chat_id]:
         user_data[chat_id]["hobbies"] = []
 
-    if msg.text not in user_data[chat_id]["hobbies"]:
-        user_data[chat_id]["hobbies"].append(msg.text)
+    if hobby not in user_data[chat_id]["hobbies"]:
+        user_data[chat_id]["hobbies"].append(hobby)
     else:
-        user_data[chat_id]["hobbies"].remove(msg.text)
-
-    ask_hobbies(chat_id)
+        user_data[chat_id]["hobbies"].remove(hobby)
 
+    # Обновляем уже отправленное сообщение вместо отправки нового
+    selected_hobbies = user_data[chat_id]["hobbies"]
+    bot.edit_message_text(
+        hobbies_text(selected_hobbies),
+        chat_id,
+        call.message.message_id,
+        reply_markup=keyboards.hobbies_markup(selected_hobbies)
+    )
+    bot.answer_callback_query(call.id)
 
-@bot.message_handler(func=lambda m: m.text == "✅ Готово" and (
-        "height" in user_data.get(m.chat.id, {}) or user_data.get(m.chat.id, {}).get("editing")))
-def check_hobbies_and_ask_location(msg):
-    if not rate_limit_check(msg.chat.id):
+@instrumented
+def check_hobbies_and_ask_location(call, _value=0):
+    chat_id = call.message.chat.id
+    if not is_choosing_hobbies(chat_id):
+        bot.answer_callback_query(call.id)
         return
 
-    chat_id = msg.chat.id
-
     # Проверяем, что выбрано хотя бы одно увлечение
     if not user_data.get(chat_id, {}).get("hobbies"):
-        safe_bot_send_message(chat_id, "Пожалуйста, выберите хотя бы одно увлечение!")
-        ask_hobbies(chat_id)
+        bot.answer_callback_query(call.id, "Пожалуйста, выберите хотя бы одно увлечение!")
         return
 
+    bot.answer_callback_query(call.id)
+    bot.edit_message_reply_markup(chat_id, call.message.message_id, reply_markup=None)
+
     if user_data[chat_id].get("editing"):
         # Режим редактирования - сохраняем увлечения и возвращаем в главное меню
         try:
@@ -251,27 +353,23 @@ def check_hobbies_and_ask_location(msg):
             del user_data[chat_id]["editing"]
 
             # Возвращаем в главное меню
-            markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-            markup.add("🔍 Начать поиск", "❤️ Мои совпадения", "✏️ Редактировать профиль")
-            safe_bot_send_message(chat_id, "Главное меню:", reply_markup=markup)
+            safe_bot_send_message(chat_id, "Главное меню:", reply_markup=keyboards.get("main_menu"))
         except Exception as e:
-            logger.error(f"Error updating hobbies for {chat_id}: {str(e)}")
+            logger.error("Error updating hobbies for %s: %s", chat_id, e)
             safe_bot_send_message(chat_id, "Произошла ошибка при обновлении увлечений.")
     else:
         # Режим регистрации - переходим к запросу локации
-        ask_location(msg.chat.id)
+        ask_location(chat_id)
 
 def ask_location(chat_id):
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    location_button = types.KeyboardButton("📍 Отправить локацию", request_location=True)
-    markup.add(location_button)
     safe_bot_send_message(
         chat_id,
         "Пожалуйста, поделитесь своей геолокацией, чтобы мы могли находить людей рядом с вами.",
-        reply_markup=markup
+        reply_markup=keyboards.get("location")
     )
 
-@bot.message_handler(content_types=['location'])
+@on_message(content_types=['location'])
+@instrumented
 def handle_location(msg):
     if not rate_limit_check(msg.chat.id):
         return
@@ -287,21 +385,17 @@ def handle_location(msg):
         ask_location(msg.chat.id)
 
 def ask_phone_verification(chat_id):
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    phone_btn = types.KeyboardButton("📱 Отправить номер телефона", request_contact=True)
-    skip_btn = types.KeyboardButton("🚫 Пропустить верификацию")
-    markup.add(phone_btn, skip_btn)
-
     safe_bot_send_message(
         chat_id,
         "Верификация по номеру телефона дает вам синюю галочку и больше доверия от других пользователей.\n\n"
         "Вы можете:\n"
         "1. Нажать кнопку ниже, чтобы поделиться номером телефона\n"
         "2. Пропустить верификацию (но ваш профиль будет менее заметен)",
-        reply_markup=markup
+        reply_markup=keyboards.get("phone_verification")
     )
 
-@bot.message_handler(func=lambda m: m.text == "🚫 Пропустить верификацию")
+@on_message(func=lambda m: m.text == "🚫 Пропустить верификацию")
+@instrumented
 def skip_verification(msg):
     if not rate_limit_check(msg.chat.id):
         return
@@ -309,7 +403,8 @@ def skip_verification(msg):
     user_data[msg.chat.id]["verified"] = False
     save_profile_after_verification(msg.chat.id)
 
-@bot.message_handler(content_types=['contact'])
+@on_message(content_types=['contact'])
+@instrumented
 def handle_contact(msg):
     if not rate_limit_check(msg.chat.id):
         return
@@ -325,14 +420,18 @@ def handle_contact(msg):
         )
 
 def save_profile_after_verification(chat_id):
+    from config import AGREEMENT_URL, PRIVACY_URL
     user_data[chat_id]["username"] = bot.get_chat(chat_id).username
     user_data[chat_id]["registered_at"] = datetime.now()
+    user_data[chat_id]["last_active"] = user_data[chat_id]["registered_at"]
 
     try:
         users.update_one(
             {"_id": chat_id},
             {
                 "$set": user_data[chat_id],
+                # Повторная регистрация после /deletemyprofile: иначе compaction унесёт новую анкету
+                "$unset": {"deleted": "", "deleted_at": ""},
                 "$setOnInsert": {
                     "liked": [],
                     "liked_by": [],
@@ -344,8 +443,7 @@ def save_profile_after_verification(chat_id):
             upsert=True
         )
 
-        markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-        markup.add("🔍 Начать поиск", "❤️ Мои совпадения", "✏️ Редактировать профиль")
+        markup = keyboards.get("main_menu")
 
         warning_text = (
             "⚠️ Помните! В интернете люди могут выдавать себя за других. "
@@ -376,17 +474,67 @@ def save_profile_after_verification(chat_id):
 
         del user_data[chat_id]
     except Exception as e:
-        logger.error(f"Error saving profile for {chat_id}: {str(e)}")
+        logger.error("Error saving profile for %s: %s", chat_id, e)
         safe_bot_send_message(chat_id, "Произошла ошибка при сохранении профиля. Попробуйте еще раз.")
 
 
-@bot.message_handler(func=lambda m: m.text == "🔍 Начать поиск")
+def activity_tiers(now):
+    """Запросы горячего, тёплого и холодного слоёв анкет по last_active"""
+    hot_since = now - timedelta(days=HOT_TIER_DAYS)
+    warm_since = now - timedelta(days=WARM_TIER_DAYS)
+    return [
+        ("hot", {"last_active": {"$gte": hot_since}}),
+        ("warm", {"last_active": {"$gte": warm_since, "$lt": hot_since}}),
+        ("cold", {"last_active": {"$not": {"$gte": warm_since}}}),
+    ]
+
+def recency_score(profile, now):
+    """От 1 (активен сейчас) до 0 (давно не заходил)"""
+    last_active = profile.get("last_active")
+    if not last_active:
+        return 0.0
+    days = max(0.0, (now - last_active).total_seconds() / 86400)
+    return 1 / (1 + days / HOT_TIER_DAYS)
+
+def filter_candidates(me, profiles, suspicious_ids):
+    """Отбирает подходящие анкеты: [(анкета, совпадение интересов, координаты)]"""
+    my_age = me.get("age", 0)
+    my_hobbies = me.get("hobbies", [])
+    candidates = []
+    for profile in profiles:
+        # Пропускаем неполные анкеты
+        if not validate_profile(profile):
+            continue
+
+        # Фильтр по возрасту
+        profile_age = profile.get("age", 0)
+        if abs(profile_age - my_age) > MAX_AGE_DIFFERENCE:
+            continue
+
+        # Фильтр по интересам
+        profile_hobbies = profile.get("hobbies", [])
+        hobby_match = compare_hobbies(my_hobbies, profile_hobbies)
+        if hobby_match < MIN_HOBBY_MATCH:
+            continue
+
+        # Проверка на подозрительные анкеты
+        suspicious, reasons = check_suspicious_profile(profile)
+        if suspicious:
+            logger.debug("Suspicious profile %s: %s", profile['_id'], reasons)
+            suspicious_ids.append(profile["_id"])
+            continue
+
+        candidates.append((profile, hobby_match, get_user_location(profile)))
+    return candidates
+
+@on_message(func=lambda m: m.text == "🔍 Начать поиск")
+@instrumented
 def start_search(msg):
     if not rate_limit_check(msg.chat.id):
         return
 
     try:
-        me = users.find_one({"_id": msg.chat.id})
+        me = find_profile(msg.chat.id)
         if not me:
             safe_bot_send_message(msg.chat.id, "Сначала зарегистрируйтесь с /start")
             return
@@ -413,60 +561,53 @@ def start_search(msg):
         if me.get("looking_for") != "Не важно":
             query["gender"] = "Женщина" if me["looking_for"] == "Женщину" else "Мужчина"
 
-        # Получаем все подходящие анкеты
-        all_profiles = list(users.find(query))
-
         # Получаем данные для фильтрации
+        now = datetime.now()
         my_location = get_user_location(me)
-        my_age = me.get("age", 0)
-        my_hobbies = me.get("hobbies", [])
-
-        filtered_profiles = []
-        for profile in all_profiles:
-            # Пропускаем неполные анкеты
-            if not validate_profile(profile):
-                continue
-
-            # Фильтр по возрасту
-            profile_age = profile.get("age", 0)
-            if abs(profile_age - my_age) > MAX_AGE_DIFFERENCE:
-                continue
-
-            # Фильтр по интересам
-            profile_hobbies = profile.get("hobbies", [])
-            hobby_match = compare_hobbies(my_hobbies, profile_hobbies)
-            if hobby_match < MIN_HOBBY_MATCH:
-                continue
-
-            # Проверка на подозрительные анкеты
-            suspicious, reasons = check_suspicious_profile(profile)
-            if suspicious:
-                logger.warning(f"Suspicious profile {profile['_id']}: {', '.join(reasons)}")
-                users.update_one({"_id": profile["_id"]}, {"$set": {"banned": True}})
-                continue
-
-            # Рассчитываем расстояние между пользователями
-            profile_location = get_user_location(profile)
-            if my_location and profile_location:
-                try:
-                    distance = calculate_distance(my_location, profile_location)
-                except Exception as e:
-                    logger.error(f"Error calculating distance: {e}")
-                    distance = float('inf')
-            else:
-                distance = float('inf')
+        candidates = []
+        suspicious_ids = []
+
+        # Читаем сначала активных, к спящим анкетам переходим, только если не хватило
+        for tier, tier_query in activity_tiers(now):
+            with metrics.span(f"search_scan_{tier}"):
+                profiles = list(users.find({**query, **tier_query}))
+            with metrics.span("search_scoring"):
+                candidates += filter_candidates(me, profiles, suspicious_ids)
+            if len(candidates) >= SEARCH_RESULTS_LIMIT:
+                break
+
+        with metrics.span("search_scoring"):
+            # Рассчитываем расстояния одним пакетом для всех анкет с координатами
+            profile_distances = [float('inf')] * len(candidates)
+            located = [i for i, candidate in enumerate(candidates) if candidate[2]]
+            if my_location and located:
+                batch = geo.distances(
+                    my_location,
+                    [candidates[i][2].lat for i in located],
+                    [candidates[i][2].lon for i in located]
+                )
+                for i, distance in zip(located, batch):
+                    profile_distances[i] = float(distance)
+
+            filtered_profiles = []
+            for (profile, hobby_match, _), distance in zip(candidates, profile_distances):
+                # Рассчитываем рейтинг анкеты
+                rating = (
+                        int(profile.get("verified", False)) * 100 +  # Верифицированные выше
+                        hobby_match * 10 +  # Совпадение интересов
+                        recency_score(profile, now) * RECENCY_WEIGHT +  # Недавно активные выше
+                        1 / (distance + 1)  # Близкие анкеты выше
+                )
+                filtered_profiles.append((profile, rating))
 
-            # Рассчитываем рейтинг анкеты
-            rating = (
-                    int(profile.get("verified", False)) * 100 +  # Верифицированные выше
-                    hobby_match * 10 +  # Совпадение интересов
-                    1 / (distance + 1)  # Близкие анкеты выше
-            )
-            filtered_profiles.append((profile, rating))
+            # Сортируем по рейтингу и берем топ-50
+            filtered_profiles.sort(key=lambda x: -x[1])
+            filtered_profiles = filtered_profiles[:SEARCH_RESULTS_LIMIT]
 
-        # Сортируем по рейтингу и берем топ-50
-        filtered_profiles.sort(key=lambda x: -x[1])
-        filtered_profiles = filtered_profiles[:50]
+        # Блокируем подозрительные анкеты одним запросом и одной записью в лог
+        if suspicious_ids:
+            users.update_many({"_id": {"$in": suspicious_ids}}, {"$set": {"banned": True}})
+            logger.warning("Banned %s suspicious profiles, first ids: %s", len(suspicious_ids), suspicious_ids[:10])
 
         if not filtered_profiles:
             safe_bot_send_message(msg.chat.id, "Пока нет подходящих анкет. Попробуйте позже.")
@@ -481,7 +622,7 @@ def start_search(msg):
         # Показываем первую анкету
         show_profile(msg.chat.id, 0)
     except Exception as e:
-        logger.error(f"Error in start_search for {msg.chat.id}: {str(e)}")
+        logger.error("Error in start_search for %s: %s", msg.chat.id, e)
         safe_bot_send_message(msg.chat.id, "Произошла ошибка при поиске. Попробуйте позже.")
 
 def show_profile(chat_id, index):
@@ -513,48 +654,49 @@ def show_profile(chat_id, index):
             f"О себе: {profile.get('bio', '')}"
         )
 
-        markup = types.InlineKeyboardMarkup(row_width=2)
-        markup.add(
-            types.InlineKeyboardButton("👍", callback_data=f"like_{profile_id}"),
-            types.InlineKeyboardButton("👎", callback_data=f"dislike_{profile_id}"),
-            types.InlineKeyboardButton("⚠️ Пожаловаться", callback_data=f"report_{profile_id}")
-        )
+        markup = keyboards.profile_markup(chat_id, profile_id)
 
         try:
             bot.send_photo(chat_id, profile['photo'], caption=text, reply_markup=markup)
         except Exception as e:
-            logger.error(f"Error sending photo to {chat_id}: {str(e)}")
+            logger.error("Error sending photo to %s: %s", chat_id, e)
             safe_bot_send_message(chat_id, text, reply_markup=markup)
     except Exception as e:
-        logger.error(f"Error showing profile to {chat_id}: {str(e)}")
+        logger.error("Error showing profile to %s: %s", chat_id, e)
         safe_bot_send_message(chat_id, "Произошла ошибка при загрузке анкеты.")
 
-@bot.callback_query_handler(func=lambda call: True)
+@on_callback(func=lambda call: True)
+@instrumented
 def handle_callback(call):
     try:
         if not rate_limit_check(call.message.chat.id):
             return
 
         chat_id = call.message.chat.id
-        if call.data.startswith('like_'):
-            handle_like(call)
-        elif call.data.startswith('dislike_'):
-            handle_dislike(call)
-        elif call.data.startswith('report_'):
-            handle_report(call)
+        try:
+            data = callbacks.decode(call.data, chat_id)
+        except callbacks.CallbackError as e:
+            logger.warning("Rejected callback from %s: %s", chat_id, e)
+            bot.answer_callback_query(call.id, "Кнопка устарела. Начните поиск заново.")
+            return
+
+        CALLBACK_HANDLERS[data.code](call, data.value)
     except Exception as e:
-        logger.error(f"Error handling callback: {str(e)}")
+        logger.error("Error handling callback: %s", e)
         try:
             bot.answer_callback_query(call.id, "Произошла ошибка. Попробуйте еще раз.")
         except:
             pass
 
-def handle_like(call):
+@instrumented
+def handle_like(call, target_id):
     chat_id = call.message.chat.id
-    target_id = int(call.data.split('_')[1])
 
     try:
-        user = users.find_one({"_id": chat_id})
+        user = find_profile(chat_id)
+        if not user:
+            bot.answer_callback_query(call.id, "Сначала зарегистрируйтесь с /start")
+            return
         if target_id in user.get("liked", []):
             bot.answer_callback_query(call.id, "Вы уже лайкали этого пользователя")
             show_next_profile(chat_id)
@@ -584,24 +726,26 @@ def handle_like(call):
                     f"Напишите ему: @{call.from_user.username or 'нет username'}"
                 )
             except Exception as e:
-                logger.error(f"Error sending match notification: {str(e)}")
+                logger.error("Error sending match notification: %s", e)
 
         bot.answer_callback_query(call.id, "Лайк отправлен!")
         show_next_profile(chat_id)
     except Exception as e:
-        logger.error(f"Error in handle_like: {str(e)}")
+        logger.error("Error in handle_like: %s", e)
         bot.answer_callback_query(call.id, "Ошибка при отправке лайка")
 
-def handle_dislike(call):
+@instrumented
+def handle_dislike(call, target_id):
     chat_id = call.message.chat.id
     try:
         bot.answer_callback_query(call.id, "Пропускаем...")
         show_next_profile(chat_id)
     except Exception as e:
-        logger.error(f"Error in handle_dislike: {str(e)}")
+        logger.error("Error in handle_dislike: %s", e)
 
-def handle_report(call):
-    target_id = int(call.data.split('_')[1])
+@instrumented
+def handle_report(call, target_id):
+    from config import ADMIN_ID
     try:
         users.update_one(
             {"_id": target_id},
@@ -609,7 +753,7 @@ def handle_report(call):
         )
 
         user = users.find_one({"_id": target_id})
-        if user.get("reports", 0) >= 3:
+        if user and user.get("reports", 0) >= 3:
             users.update_one(
                 {"_id": target_id},
                 {"$set": {"banned": True}}
@@ -619,7 +763,16 @@ def handle_report(call):
                 f"Профиль {target_id} автоматически заблокирован из-за 3 жалоб"
             )
     except Exception as e:
-        logger.error(f"Error processing report: {str(e)}")
+        logger.error("Error processing report: %s", e)
+
+# Таблица обработчиков инлайн-кнопок: код действия -> функция(call, value)
+CALLBACK_HANDLERS = {
+    callbacks.LIKE: handle_like,
+    callbacks.DISLIKE: handle_dislike,
+    callbacks.REPORT: handle_report,
+    callbacks.HOBBY: handle_hobby_selection,
+    callbacks.HOBBIES_DONE: check_hobbies_and_ask_location,
+}
 
 def show_next_profile(chat_id):
     try:
@@ -633,16 +786,17 @@ def show_next_profile(chat_id):
         user_data[chat_id]["current_index"] = current_index
         show_profile(chat_id, current_index)
     except Exception as e:
-        logger.error(f"Error in show_next_profile for {chat_id}: {str(e)}")
+        logger.error("Error in show_next_profile for %s: %s", chat_id, e)
         safe_bot_send_message(chat_id, "Произошла ошибка при загрузке следующей анкеты.")
 
-@bot.message_handler(func=lambda m: m.text == "❤️ Мои совпадения")
+@on_message(func=lambda m: m.text == "❤️ Мои совпадения")
+@instrumented
 def show_matches(msg):
     if not rate_limit_check(msg.chat.id):
         return
 
     try:
-        user = users.find_one({"_id": msg.chat.id})
+        user = find_profile(msg.chat.id)
         if not user:
             safe_bot_send_message(msg.chat.id, "Сначала зарегистрируйтесь с /start")
             return
@@ -671,35 +825,25 @@ def show_matches(msg):
                 )
                 bot.send_photo(msg.chat.id, match['photo'], caption=text)
             except Exception as e:
-                logger.error(f"Error showing match to {msg.chat.id}: {str(e)}")
+                logger.error("Error showing match to %s: %s", msg.chat.id, e)
                 safe_bot_send_message(msg.chat.id, text)
     except Exception as e:
-        logger.error(f"Error in show_matches for {msg.chat.id}: {str(e)}")
+        logger.error("Error in show_matches for %s: %s", msg.chat.id, e)
         safe_bot_send_message(msg.chat.id, "Произошла ошибка при загрузке совпадений.")
 
-@bot.message_handler(func=lambda m: m.text == "✏️ Редактировать профиль")
+@on_message(func=lambda m: m.text == "✏️ Редактировать профиль")
+@instrumented
 def edit_profile(msg):
     if not rate_limit_check(msg.chat.id):
         return
 
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    items = [
-        "✏️ Изменить имя",
-        "✏️ Изменить фото",
-        "✏️ Изменить описание",
-        "✏️ Изменить увлечения"
-    ]
-
-    user = users.find_one({"_id": msg.chat.id})
-    if not user.get("verified", False):
-        items.append("📱 Пройти верификацию")
-
-    items.append("◀️ Назад")
-    markup.add(*items)
+    user = find_profile(msg.chat.id)
+    markup = keyboards.edit_profile_markup(user.get("verified", False))
 
     safe_bot_send_message(msg.chat.id, "Что вы хотите изменить?", reply_markup=markup)
 
-@bot.message_handler(func=lambda m: m.text.startswith("✏️ Изменить"))
+@on_message(func=lambda m: m.text.startswith("✏️ Изменить"))
+@instrumented
 def handle_edit_choice(msg):
     if not rate_limit_check(msg.chat.id):
         return
@@ -717,13 +861,15 @@ def handle_edit_choice(msg):
         user_data[msg.chat.id] = {"editing": True}
         ask_hobbies(msg.chat.id)
 
-@bot.message_handler(func=lambda m: m.text == "📱 Пройти верификацию")
+@on_message(func=lambda m: m.text == "📱 Пройти верификацию")
+@instrumented
 def request_verification(msg):
     if not rate_limit_check(msg.chat.id):
         return
 
     ask_phone_verification(msg.chat.id)
 
+@instrumented
 def process_new_name(msg):
     if not rate_limit_check(msg.chat.id):
         return
@@ -737,9 +883,10 @@ def process_new_name(msg):
         users.update_one({"_id": msg.chat.id}, {"$set": {"name": msg.text.strip()}})
         safe_bot_send_message(msg.chat.id, "Имя обновлено!")
     except Exception as e:
-        logger.error(f"Error updating name for {msg.chat.id}: {str(e)}")
+        logger.error("Error updating name for %s: %s", msg.chat.id, e)
         safe_bot_send_message(msg.chat.id, "Произошла ошибка при обновлении имени.")
 
+@instrumented
 def process_new_photo(msg):
     if not rate_limit_check(msg.chat.id):
         return
@@ -753,9 +900,10 @@ def process_new_photo(msg):
         users.update_one({"_id": msg.chat.id}, {"$set": {"photo": photo_id}})
         safe_bot_send_message(msg.chat.id, "Фото обновлено!")
     except Exception as e:
-        logger.error(f"Error updating photo for {msg.chat.id}: {str(e)}")
+        logger.error("Error updating photo for %s: %s", msg.chat.id, e)
         safe_bot_send_message(msg.chat.id, "Произошла ошибка при обновлении фото.")
 
+@instrumented
 def process_new_bio(msg):
     if not rate_limit_check(msg.chat.id):
         return
@@ -764,30 +912,30 @@ def process_new_bio(msg):
         users.update_one({"_id": msg.chat.id}, {"$set": {"bio": msg.text}})
         safe_bot_send_message(msg.chat.id, "Описание обновлено!")
     except Exception as e:
-        logger.error(f"Error updating bio for {msg.chat.id}: {str(e)}")
+        logger.error("Error updating bio for %s: %s", msg.chat.id, e)
         safe_bot_send_message(msg.chat.id, "Произошла ошибка при обновлении описания.")
 
-@bot.message_handler(func=lambda m: m.text == "◀️ Назад")
+@on_message(func=lambda m: m.text == "◀️ Назад")
+@instrumented
 def back_to_main(msg):
     if not rate_limit_check(msg.chat.id):
         return
 
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.add("🔍 Начать поиск", "❤️ Мои совпадения", "✏️ Редактировать профиль")
-    safe_bot_send_message(msg.chat.id, "Главное меню:", reply_markup=markup)
+    safe_bot_send_message(msg.chat.id, "Главное меню:", reply_markup=keyboards.get("main_menu"))
 
-@bot.message_handler(commands=['deletemyprofile'])
+@on_message(commands=['deletemyprofile'])
+@instrumented
 def delete_profile(msg):
     if not rate_limit_check(msg.chat.id):
         return
 
     try:
-        user = users.find_one({"_id": msg.chat.id})
+        user = find_profile(msg.chat.id)
         if not user:
             safe_bot_send_message(msg.chat.id, "Профиль не найден.")
             return
 
-        old_profiles.insert_one(user)
+        old_profiles.replace_one({"_id": msg.chat.id}, user, upsert=True)
 
         users.update_one(
             {"_id": msg.chat.id},
@@ -801,10 +949,76 @@ def delete_profile(msg):
 
         safe_bot_send_message(msg.chat.id, "Ваш профиль был удален. Спасибо, что были с нами!")
     except Exception as e:
-        logger.error(f"Error deleting profile {msg.chat.id}: {str(e)}")
+        logger.error("Error deleting profile %s: %s", msg.chat.id, e)
         safe_bot_send_message(msg.chat.id, "Произошла ошибка при удалении профиля.")
 
-@bot.message_handler(func=lambda m: True)
+def is_admin(msg):
+    from config import ADMIN_ID
+    return msg.chat.id == ADMIN_ID
+
+CAMPAIGN_USAGE = (
+    "Использование:\n"
+    "/campaign <аудитория> [текст] - запустить рассылку\n"
+    "/campaigns - прогресс последних рассылок\n"
+    "/campaign_stop <id> - остановить рассылку\n\n"
+    f"Аудитории: {', '.join(campaigns.AUDIENCES)}\n"
+    f"Подстановки в тексте: {', '.join('{' + p + '}' for p in campaigns.PLACEHOLDERS)}"
+)
+
+@on_message(commands=['campaign'], func=is_admin)
+@instrumented
+def start_campaign(msg):
+    parts = msg.text.split(maxsplit=2)
+    if len(parts) < 2:
+        safe_bot_send_message(msg.chat.id, CAMPAIGN_USAGE)
+        return
+
+    try:
+        campaign_id = campaigns.create(parts[1], parts[2] if len(parts) > 2 else None)
+    except ValueError as e:
+        safe_bot_send_message(msg.chat.id, f"{e}\n\n{CAMPAIGN_USAGE}")
+        return
+    except Exception as e:
+        logger.error("Error creating campaign: %s", e)
+        safe_bot_send_message(msg.chat.id, "Произошла ошибка при создании рассылки.")
+        return
+
+    campaigns.start(bot, campaign_id, report_to=msg.chat.id)
+    safe_bot_send_message(
+        msg.chat.id,
+        f"Рассылка {campaign_id} запущена. Прогресс: /campaigns, остановить: /campaign_stop {campaign_id}"
+    )
+
+@on_message(commands=['campaigns'], func=is_admin)
+@instrumented
+def show_campaigns(msg):
+    try:
+        states = campaigns.recent()
+    except Exception as e:
+        logger.error("Error loading campaigns: %s", e)
+        safe_bot_send_message(msg.chat.id, "Произошла ошибка при загрузке рассылок.")
+        return
+
+    if not states:
+        safe_bot_send_message(msg.chat.id, "Рассылок пока не было.")
+        return
+    safe_bot_send_message(msg.chat.id, "\n\n".join(campaigns.format_status(state) for state in states))
+
+@on_message(commands=['campaign_stop'], func=is_admin)
+@instrumented
+def stop_campaign(msg):
+    parts = msg.text.split()
+    if len(parts) != 2:
+        safe_bot_send_message(msg.chat.id, CAMPAIGN_USAGE)
+        return
+
+    if campaigns.stop(parts[1]):
+        safe_bot_send_message(msg.chat.id, f"Рассылка {parts[1]} остановится после текущей пачки.")
+    else:
+        safe_bot_send_message(msg.chat.id, f"Рассылка {parts[1]} не найдена или уже не идёт.")
+
+@on_message(func=lambda m: True)
+@instrumented
 def handle_unexpected_messages(msg):
     if not rate_limit_check(msg.chat.id):
         return
@@ -812,25 +1026,8 @@ def handle_unexpected_messages(msg):
     if msg.chat.id in user_data:
         safe_bot_send_message(msg.chat.id, "Пожалуйста, следуйте инструкциям для завершения регистрации.")
     else:
-        markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-        markup.add("🔍 Начать поиск", "❤️ Мои совпадения", "✏️ Редактировать профиль")
-        safe_bot_send_message(msg.chat.id, "Выберите действие из меню:", reply_markup=markup)
-
-def run_bot():
-    while True:
-        try:
-            logger.info("Starting bot polling...")
-            bot.infinity_polling(
-                timeout=60,
-                long_polling_timeout=60,
-                restart_on_change=True,
-                skip_pending=True
-            )
-        except Exception as e:
-            logger.error(f"Bot crashed with error: {str(e)}")
-            logger.info("Restarting bot in 30 seconds...")
-            time.sleep(30)
+        safe_bot_send_message(msg.chat.id, "Выберите действие из меню:", reply_markup=keyboards.get("main_menu"))
 
 if __name__ == "__main__":
-    logger.info("Бот запущен...")
-    run_bot()
\ No newline at end of file
+    import app
+    app.main()
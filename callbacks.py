@@ -0,0 +1,115 @@
+import base64
+import hashlib
+import hmac
+import string
+from collections import namedtuple
+
+# Формат callback_data: <версия><код действия><id в base62>[<подпись>]
+# Например "1lBq7Ro0x3aFk" вместо "like_1234567890" — короче и не подделать.
+VERSION = "1"
+SIGNATURE_LENGTH = 8  # 6 байт HMAC в urlsafe base64
+MAX_CALLBACK_DATA = 64  # Ограничение Telegram
+
+_ALPHABET = string.digits + string.ascii_letters
+_BASE = len(_ALPHABET)
+_INDEX = {char: i for i, char in enumerate(_ALPHABET)}
+
+Callback = namedtuple("Callback", ["action", "code", "value"])
+
+
+class CallbackError(ValueError):
+    """Некорректные, устаревшие или поддельные данные кнопки"""
+
+
+_actions = {}  # код -> (имя, нужна ли подпись)
+_key = None
+
+
+def register_action(name, code, signed=False):
+    """Регистрирует действие с однобуквенным кодом"""
+    if len(code) != 1 or code not in _INDEX:
+        raise ValueError(f"Action code must be a single base62 character: {code!r}")
+    if code in _actions and _actions[code][0] != name:
+        raise ValueError(f"Action code {code!r} is already used by {_actions[code][0]}")
+    _actions[code] = (name, signed)
+    return code
+
+
+LIKE = register_action("like", "l", signed=True)
+DISLIKE = register_action("dislike", "d", signed=True)
+REPORT = register_action("report", "r", signed=True)
+HOBBY = register_action("hobby", "h")
+HOBBIES_DONE = register_action("hobbies_done", "H")
+
+
+def set_secret(secret):
+    """Задаёт ключ для подписи кнопок (обычно производный от токена бота)"""
+    global _key
+    if isinstance(secret, str):
+        secret = secret.encode()
+    _key = hashlib.sha256(b"callback_data:" + secret).digest()
+
+
+def to_base62(value):
+    if value < 0:
+        return "-" + to_base62(-value)
+    if value == 0:
+        return _ALPHABET[0]
+    chars = []
+    while value:
+        value, rem = divmod(value, _BASE)
+        chars.append(_ALPHABET[rem])
+    return "".join(reversed(chars))
+
+
+def from_base62(text):
+    if text.startswith("-"):
+        return -from_base62(text[1:])
+    if not text:
+        raise CallbackError("Empty value")
+    value = 0
+    for char in text:
+        try:
+            value = value * _BASE + _INDEX[char]
+        except KeyError:
+            raise CallbackError(f"Invalid base62 character: {char!r}")
+    return value
+
+
+def _sign(body, chat_id):
+    if _key is None:
+        raise RuntimeError("Callback secret is not set, call callbacks.set_secret() first")
+    digest = hmac.new(_key, f"{body}:{chat_id}".encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:6]).decode()
+
+
+def encode(code, value=0, chat_id=None):
+    """Кодирует нажатие кнопки; подписанные действия привязываются к chat_id получателя"""
+    if code not in _actions:
+        raise ValueError(f"Unknown action code: {code!r}")
+    data = VERSION + code + to_base62(value)
+    if _actions[code][1]:
+        data += _sign(data, chat_id)
+    if len(data.encode()) > MAX_CALLBACK_DATA:
+        raise ValueError(f"Callback data is too long: {data!r}")
+    return data
+
+
+def decode(data, chat_id=None):
+    """Раскодирует callback_data, проверяя версию и подпись"""
+    if not data or len(data) < 3 or data[0] != VERSION:
+        raise CallbackError(f"Unsupported callback data: {data!r}")
+
+    code = data[1]
+    if code not in _actions:
+        raise CallbackError(f"Unknown action code: {code!r}")
+    name, signed = _actions[code]
+
+    payload = data[2:]
+    if signed:
+        body, signature = data[:-SIGNATURE_LENGTH], data[-SIGNATURE_LENGTH:]
+        payload = body[2:]
+        if not payload or not hmac.compare_digest(signature, _sign(body, chat_id)):
+            raise CallbackError(f"Bad signature for {name} from {chat_id}")
+
+    return Callback(name, code, from_base62(payload))
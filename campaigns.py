@@ -0,0 +1,472 @@
+"""Массовые рассылки по базе пользователей.
+
+Рассылку запускает администратор командой /campaign в боте или из
+консоли. Получатели читаются из users пачками по возрастанию _id,
+текст собирается из шаблона с подстановками ({name}, {likes}),
+сообщения отправляются из пула потоков с общим темпом не выше
+SEND_RATE в секунду. После каждой пачки прогресс и счётчики
+(доставлено, бота заблокировали, ошибки, пропущено) сохраняются
+в коллекции jobs, поэтому после падения рассылка продолжается
+с последней сохранённой пачки: повторно могут уйти не больше
+BATCH_SIZE сообщений.
+
+Рассылку отправляет только один процесс: перед отправкой он берёт
+аренду (owner, lease_until) и продлевает её на каждой пачке. Бот
+ждёт, пока аренда чужого процесса истечёт, и тогда подхватывает
+рассылку; консольный запуск при занятой аренде просто завершается.
+
+    python campaigns.py start unseen_likes
+    python campaigns.py start all --text "{name}, мы обновили правила"
+    python campaigns.py resume 20240101120000
+    python campaigns.py status
+    python campaigns.py stop 20240101120000
+"""
+import argparse
+import logging
+import os
+import socket
+import string
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import metrics
+from database import users, jobs
+
+SEND_RATE = 25  # Сообщений в секунду на все потоки; общий лимит Telegram ~30
+WORKERS = 8
+BATCH_SIZE = 200
+MAX_ATTEMPTS = 3  # Попыток на сообщение, не считая ответов 429
+INACTIVE_DAYS = 30
+MAX_MESSAGE_LENGTH = 4096
+LEASE_SECONDS = 300  # Аренда рассылки продлевается на каждой пачке и перед паузой после 429
+
+RUNNING = "running"
+FINISHED = "finished"
+STOPPED = "stopped"
+
+DELIVERED = "delivered"
+BLOCKED = "blocked"
+FAILED = "failed"
+SKIPPED = "skipped"
+RESULTS = [DELIVERED, BLOCKED, FAILED, SKIPPED]
+
+logger = logging.getLogger(__name__)
+
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+
+_stopping = threading.Event()
+_running = {}  # id рассылки -> поток
+_running_lock = threading.Lock()
+
+
+def unseen_likes(doc):
+    """Сколько пользователей лайкнули анкету, а она их ещё не видела"""
+    return len(set(doc.get("liked_by") or []) - set(doc.get("viewed") or []))
+
+
+# Подстановки в шаблонах: имя -> (поля анкеты, функция от анкеты)
+PLACEHOLDERS = {
+    "name": (["name"], lambda doc: doc.get("name") or "друг"),
+    "likes": (["liked_by", "viewed"], unseen_likes),
+}
+
+
+def _reachable(now):
+    return {"banned": {"$ne": True}, "deleted": {"$ne": True}, "blocked_bot": {"$ne": True}}
+
+
+def _with_likes(now):
+    return dict(_reachable(now), **{"liked_by.0": {"$exists": True}})
+
+
+def _inactive(now):
+    # Анкеты без last_active (зарегистрированные до его появления) тоже считаем неактивными
+    return dict(_reachable(now), last_active={"$not": {"$gte": now - timedelta(days=INACTIVE_DAYS)}})
+
+
+# Аудитории: запрос к users, поля для отбора и отбор по уже прочитанной анкете
+Audience = namedtuple("Audience", "query fields keep")
+
+AUDIENCES = {
+    "all": Audience(_reachable, [], None),
+    "unseen_likes": Audience(_with_likes, ["liked_by", "viewed"], lambda doc: unseen_likes(doc) > 0),
+    "inactive": Audience(_inactive, [], None),
+}
+
+# Шаблоны по умолчанию; для остальных аудиторий текст задаёт администратор
+TEMPLATES = {
+    "unseen_likes": "💌 {name}, вас лайкнули {likes} чел. Загляните в «🔍 Начать поиск», чтобы ответить взаимностью!",
+    "inactive": "👋 {name}, за время вашего отсутствия появились новые анкеты. Загляните в «🔍 Начать поиск»!",
+}
+
+
+def template_fields(text):
+    """Подстановки шаблона; ValueError, если шаблон некорректен"""
+    fields = {name for _, name, _, _ in string.Formatter().parse(text) if name is not None}
+    unknown = fields - PLACEHOLDERS.keys()
+    if unknown:
+        raise ValueError(
+            f"Неизвестные подстановки: {', '.join(sorted(unknown))}. "
+            f"Доступны: {', '.join('{' + p + '}' for p in PLACEHOLDERS)}"
+        )
+    return fields
+
+
+def render(text, doc, fields):
+    return text.format_map({field: PLACEHOLDERS[field][1](doc) for field in fields})
+
+
+class RateLimiter:
+    """Равномерный темп отправки, общий для всех потоков"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self, stop):
+        """Ждёт своей очереди; False, если за это время выставлен stop"""
+        with self._lock:
+            slot = max(self._next, time.monotonic())
+            self._next = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            return not stop.wait(delay)
+        return not stop.is_set()
+
+    def pause(self, seconds):
+        """После 429 все потоки ждут retry_after секунд"""
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + seconds)
+
+
+def _unreachable(error):
+    """Бот заблокирован, аккаунт удалён или чат не существует"""
+    description = str((error.result_json or {}).get("description", "")).lower()
+    return error.error_code == 403 or (error.error_code == 400 and "chat not found" in description)
+
+
+def send(bot, chat_id, text, limiter, extend_lease):
+    """Отправляет одно сообщение рассылки и возвращает результат.
+
+    None — сообщение не отправлено, потому что рассылку останавливают или
+    аренду забрал другой процесс; такую пачку нельзя засчитывать.
+    """
+    from telebot.apihelper import ApiTelegramException
+
+    attempt = 0
+    while attempt < MAX_ATTEMPTS:
+        if not limiter.wait(_stopping):
+            return None
+        try:
+            bot.send_message(chat_id, text)
+            return DELIVERED
+        except ApiTelegramException as e:
+            if e.error_code == 429:
+                retry_after = (e.result_json or {}).get("parameters", {}).get("retry_after", 1)
+                logger.warning("Campaign hit flood limit, pausing for %ss", retry_after)
+                # Пауза может быть дольше аренды: продлеваем её заранее
+                if not extend_lease(retry_after):
+                    return None
+                limiter.pause(retry_after)
+                continue
+            if _unreachable(e):
+                return BLOCKED
+            logger.warning("Campaign send to %s failed: %s", chat_id, e)
+        except Exception as e:
+            logger.warning("Campaign send to %s failed: %s", chat_id, e)
+        attempt += 1
+        if attempt < MAX_ATTEMPTS:
+            time.sleep(2 ** attempt)
+    return FAILED
+
+
+def _job_id(campaign_id):
+    return f"campaign:{campaign_id}"
+
+
+def create(audience, text=None, now=None):
+    """Сохраняет новую рассылку и возвращает её id; ValueError при ошибке в параметрах"""
+    if audience not in AUDIENCES:
+        raise ValueError(f"Неизвестная аудитория: {audience}. Доступны: {', '.join(AUDIENCES)}")
+    text = text or TEMPLATES.get(audience)
+    if not text:
+        raise ValueError(f"Для аудитории {audience} нужен текст сообщения")
+    if len(text) > MAX_MESSAGE_LENGTH:
+        raise ValueError(f"Текст длиннее {MAX_MESSAGE_LENGTH} символов")
+    template_fields(text)
+
+    from pymongo.errors import DuplicateKeyError
+
+    now = now or datetime.now()
+    base_id = now.strftime("%Y%m%d%H%M%S")
+    for attempt in range(1, 100):
+        # Несколько рассылок в одну секунду получают суффикс: 20240101120000-2
+        campaign_id = base_id if attempt == 1 else f"{base_id}-{attempt}"
+        try:
+            jobs.insert_one({
+                "_id": _job_id(campaign_id),
+                "type": "campaign",
+                "campaign_id": campaign_id,
+                "audience": audience,
+                "text": text,
+                "status": RUNNING,
+                "created_at": now,
+                **{result: 0 for result in RESULTS}
+            })
+            return campaign_id
+        except DuplicateKeyError:
+            continue
+    raise ValueError("Слишком много рассылок за одну секунду, попробуйте ещё раз")
+
+
+def get(campaign_id):
+    return jobs.find_one({"_id": _job_id(campaign_id)})
+
+
+def recent(limit=5):
+    return list(jobs.find({"type": "campaign"}).sort("created_at", -1).limit(limit))
+
+
+def stop(campaign_id):
+    """Останавливает рассылку после текущей пачки; False, если она уже не идёт"""
+    result = jobs.update_one({"_id": _job_id(campaign_id), "status": RUNNING}, {"$set": {"status": STOPPED}})
+    return result.modified_count > 0
+
+
+def format_status(state):
+    return (
+        f"Рассылка {state['campaign_id']} ({state['audience']}): {state['status']}\n"
+        f"Доставлено: {state.get(DELIVERED, 0)}, заблокировали бота: {state.get(BLOCKED, 0)}, "
+        f"ошибки: {state.get(FAILED, 0)}, пропущено: {state.get(SKIPPED, 0)}"
+    )
+
+
+def _acquire(job_id):
+    """Берёт аренду рассылки; None, если она не идёт или её отправляет другой процесс"""
+    from pymongo import ReturnDocument
+    now = datetime.now()
+    return jobs.find_one_and_update(
+        {
+            "_id": job_id,
+            "status": RUNNING,
+            "$or": [{"owner": OWNER}, {"lease_until": {"$not": {"$gt": now}}}],
+        },
+        {"$set": {"owner": OWNER, "lease_until": now + timedelta(seconds=LEASE_SECONDS)}},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def _extend(job_id, seconds):
+    """Продлевает аренду ещё на seconds; False, если она уже у другого процесса"""
+    result = jobs.update_one(
+        {"_id": job_id, "owner": OWNER},
+        {"$max": {"lease_until": datetime.now() + timedelta(seconds=seconds + LEASE_SECONDS)}}
+    )
+    return result.matched_count > 0
+
+
+def _release(job_id):
+    jobs.update_one({"_id": job_id, "owner": OWNER}, {"$unset": {"owner": "", "lease_until": ""}})
+
+
+def run(bot, campaign_id, rate=SEND_RATE, workers=WORKERS, batch_size=BATCH_SIZE, wait=False):
+    """Отправляет рассылку с последней сохранённой пачки; возвращает её состояние.
+
+    Если рассылку отправляет другой процесс, с wait=True ждёт окончания его
+    аренды, иначе сразу возвращает текущее состояние.
+    """
+    job_id = _job_id(campaign_id)
+    state = _acquire(job_id)
+    while state is None:
+        current = jobs.find_one({"_id": job_id})
+        if current is None:
+            raise ValueError(f"Рассылка {campaign_id} не найдена")
+        if current["status"] != RUNNING or not wait or _stopping.is_set():
+            if current["status"] == RUNNING:
+                logger.warning("Campaign %s is being sent by %s", campaign_id, current.get("owner"))
+            return current
+        lease_until = current.get("lease_until") or datetime.now()
+        _stopping.wait(max(1.0, (lease_until - datetime.now()).total_seconds()))
+        state = _acquire(job_id)
+
+    try:
+        _send_batches(bot, state, rate, workers, batch_size)
+    finally:
+        _release(job_id)
+    return jobs.find_one({"_id": job_id})
+
+
+def _send_batches(bot, state, rate, workers, batch_size):
+    from pymongo import ReturnDocument
+    campaign_id = state["campaign_id"]
+    job_id = state["_id"]
+
+    audience = AUDIENCES[state["audience"]]
+    text = state["text"]
+    fields = template_fields(text)
+    projection = {"_id": 1}
+    for field in fields:
+        projection.update(dict.fromkeys(PLACEHOLDERS[field][0], 1))
+    projection.update(dict.fromkeys(audience.fields, 1))
+
+    limiter = RateLimiter(rate)
+    last_id = state.get("last_id")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"campaign-{campaign_id}") as pool:
+        while not _stopping.is_set() and state["status"] == RUNNING:
+            now = datetime.now()
+            query = audience.query(now)
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+
+            batch = list(users.find(query, projection).sort("_id", 1).limit(batch_size))
+            if not batch:
+                jobs.update_one({"_id": job_id, "owner": OWNER}, {"$set": {"status": FINISHED, "finished_at": now}})
+                break
+
+            recipients = [doc for doc in batch if audience.keep is None or audience.keep(doc)]
+            results = list(pool.map(
+                lambda doc: send(bot, doc["_id"], render(text, doc, fields), limiter,
+                                 lambda seconds: _extend(job_id, seconds)),
+                recipients
+            ))
+            if None in results:
+                # Пачка прервана: без сохранения прогресса её целиком повторит следующий запуск
+                logger.warning("Campaign %s batch after %s interrupted", campaign_id, last_id)
+                break
+            counts = Counter(results)
+            counts[SKIPPED] = len(batch) - len(recipients)
+
+            # Заблокировавших бота не берём в следующие рассылки
+            blocked = [doc["_id"] for doc, result in zip(recipients, results) if result == BLOCKED]
+            if blocked:
+                users.update_many({"_id": {"$in": blocked}}, {"$set": {"blocked_bot": True}})
+
+            last_id = batch[-1]["_id"]
+            for result, count in counts.items():
+                metrics.CAMPAIGN_MESSAGES.labels(result).inc(count)
+            logger.info("Campaign %s batch up to %s: %s", campaign_id, last_id, dict(counts))
+
+            # Сохраняем прогресс и продлеваем аренду; в ответе новый статус,
+            # администратор мог остановить рассылку, пока шла пачка
+            state = jobs.find_one_and_update(
+                {"_id": job_id, "owner": OWNER},
+                {
+                    "$set": {
+                        "last_id": last_id,
+                        "updated_at": now,
+                        "lease_until": datetime.now() + timedelta(seconds=LEASE_SECONDS)
+                    },
+                    "$inc": dict(counts)
+                },
+                projection={"status": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            if state is None:
+                logger.warning("Campaign %s lease was taken over, stopping", campaign_id)
+                break
+
+
+def _run_and_report(bot, campaign_id, report_to):
+    try:
+        state = run(bot, campaign_id, wait=True)
+    except Exception as e:
+        logger.error("Campaign %s crashed: %s", campaign_id, e)
+        return
+    logger.info("%s", format_status(state))
+    if report_to is not None and state["status"] != RUNNING:
+        try:
+            bot.send_message(report_to, format_status(state))
+        except Exception as e:
+            logger.error("Error sending campaign report: %s", e)
+
+
+def start(bot, campaign_id, report_to=None):
+    """Запускает рассылку в фоновом потоке; False, если она уже идёт"""
+    with _running_lock:
+        thread = _running.get(campaign_id)
+        if thread is not None and thread.is_alive():
+            return False
+        thread = threading.Thread(
+            target=_run_and_report,
+            args=(bot, campaign_id, report_to),
+            name=f"campaign-{campaign_id}",
+            daemon=True
+        )
+        _running[campaign_id] = thread
+        thread.start()
+    return True
+
+
+def resume_all(bot, report_to=None):
+    """Продолжает рассылки, прерванные остановкой или падением процесса"""
+    resumed = [
+        state["campaign_id"] for state in jobs.find({"type": "campaign", "status": RUNNING})
+        if start(bot, state["campaign_id"], report_to)
+    ]
+    if resumed:
+        logger.info("Resumed campaigns: %s", resumed)
+    return resumed
+
+
+def shutdown(timeout):
+    """Просит рассылки остановиться после текущей пачки и ждёт их"""
+    _stopping.set()
+    deadline = time.monotonic() + timeout
+    with _running_lock:
+        threads = list(_running.values())
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.monotonic()))
+    return not any(thread.is_alive() for thread in threads)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Массовые рассылки")
+    commands = parser.add_subparsers(dest="command", required=True)
+    start_parser = commands.add_parser("start", help="Создать и отправить рассылку")
+    start_parser.add_argument("audience", choices=list(AUDIENCES))
+    start_parser.add_argument("--text", help="Шаблон сообщения, по умолчанию из TEMPLATES")
+    resume_parser = commands.add_parser("resume", help="Продолжить прерванную рассылку")
+    resume_parser.add_argument("campaign_id")
+    for sub in (start_parser, resume_parser):
+        sub.add_argument("--rate", type=float, default=SEND_RATE)
+        sub.add_argument("--workers", type=int, default=WORKERS)
+        sub.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    status_parser = commands.add_parser("status", help="Прогресс рассылок")
+    status_parser.add_argument("campaign_id", nargs="?")
+    stop_parser = commands.add_parser("stop", help="Остановить рассылку")
+    stop_parser.add_argument("campaign_id")
+    args = parser.parse_args(argv)
+
+    import logs
+    logs.setup_logging()
+
+    if args.command == "status":
+        states = [get(args.campaign_id)] if args.campaign_id else recent()
+        for state in states:
+            print(format_status(state) if state else "Рассылка не найдена")
+        return
+    if args.command == "stop":
+        print("Остановлена" if stop(args.campaign_id) else "Рассылка не идёт")
+        return
+
+    campaign_id = create(args.audience, args.text) if args.command == "start" else args.campaign_id
+    if args.command == "resume":
+        # Остановленную администратором рассылку можно продолжить явно
+        jobs.update_one({"_id": _job_id(campaign_id), "status": STOPPED}, {"$set": {"status": RUNNING}})
+
+    from config import TOKEN
+    import bot as bot_module
+    state = run(
+        bot_module.create_bot(TOKEN, threaded=False), campaign_id,
+        rate=args.rate, workers=args.workers, batch_size=args.batch_size
+    )
+    print(format_status(state))
+
+
+if __name__ == "__main__":
+    main()
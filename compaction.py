@@ -0,0 +1,199 @@
+"""Фоновое уплотнение коллекции users.
+
+Удалённые и давно неактивные анкеты переносятся из users в архив
+(old_profiles и archived_profiles). Id удалённых анкет вычищаются из
+массивов liked, liked_by и viewed остальных пользователей; у неактивных
+связи остаются, чтобы после возвращения пользователя не пропали его
+симпатии. Работа идёт пачками по возрастанию _id, прогресс сохраняется
+в коллекции jobs, поэтому после падения задача продолжает с того же
+места.
+
+    python compaction.py            # один проход
+    python compaction.py --forever  # повторять каждые --interval секунд
+"""
+import argparse
+import logging
+import time
+from datetime import datetime, timedelta
+
+from database import users, old_profiles, archived_profiles, jobs
+
+JOB_ID = "compaction"
+BATCH_SIZE = 500
+BATCH_PAUSE = 1.0  # Секунды между пачками, чтобы не мешать основной нагрузке
+WORK_PAUSE_RATIO = 1.0  # Пауза не короче времени, потраченного на пачку
+PEAK_HOURS = range(18, 24)  # В часы пик задача ждёт
+INACTIVE_DAYS = 180
+GRAPH_FIELDS = ["liked", "liked_by", "viewed"]
+
+logger = logging.getLogger(__name__)
+
+
+def stale_query(now=None):
+    """Анкеты, которые пора убрать из горячей коллекции"""
+    cutoff = (now or datetime.now()) - timedelta(days=INACTIVE_DAYS)
+    return {
+        "$or": [
+            {"deleted": True},
+            {
+                "registered_at": {"$lt": cutoff},
+                "last_active": {"$not": {"$gte": cutoff}},
+                "last_viewed": {"$not": {"$gte": cutoff}},
+            },
+        ]
+    }
+
+
+def _archive(batch, now):
+    """Копирует пачку в архив; повторный запуск просто перезапишет копии"""
+    from pymongo import ReplaceOne
+    deleted = [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in batch if doc.get("deleted")]
+    inactive = [
+        ReplaceOne({"_id": doc["_id"]}, dict(doc, archived_at=now), upsert=True)
+        for doc in batch if not doc.get("deleted")
+    ]
+    if deleted:
+        old_profiles.bulk_write(deleted, ordered=False)
+    if inactive:
+        archived_profiles.bulk_write(inactive, ordered=False)
+
+
+def _prune(ids):
+    """Убирает из графа id удалённых анкет, которых больше нет в users"""
+    from pymongo import UpdateMany
+    present = {doc["_id"] for doc in users.find({"_id": {"$in": ids}}, {"_id": 1})}
+    if present:
+        # Пользователь вернулся, пока шла пачка — его копия в архиве не нужна
+        archived_profiles.delete_many({"_id": {"$in": list(present)}})
+    moved = [i for i in ids if i not in present]
+    if not moved:
+        return 0
+
+    # Неактивные анкеты можно вернуть из архива, их связи не трогаем
+    restorable = {doc["_id"] for doc in archived_profiles.find({"_id": {"$in": moved}}, {"_id": 1})}
+    deleted = [i for i in moved if i not in restorable]
+    if deleted:
+        users.bulk_write(
+            [UpdateMany({field: {"$in": deleted}}, {"$pull": {field: {"$in": deleted}}}) for field in GRAPH_FIELDS],
+            ordered=False
+        )
+    return len(moved)
+
+
+def _wait_for_off_peak(peak_hours):
+    while datetime.now().hour in peak_hours:
+        time.sleep(60)
+
+
+def compact(batch_size=BATCH_SIZE, pause=BATCH_PAUSE, peak_hours=PEAK_HOURS, max_batches=None):
+    """Один проход по коллекции; возвращает число перенесённых анкет"""
+    state = jobs.find_one({"_id": JOB_ID}) or {}
+    last_id = state.get("last_id")
+    moved_total = 0
+
+    # Доделываем пачку, на которой задача упала
+    if state.get("pending"):
+        moved_total += _prune(state["pending"])
+        jobs.update_one({"_id": JOB_ID}, {"$unset": {"pending": ""}})
+
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        _wait_for_off_peak(peak_hours)
+        started = time.monotonic()
+        now = datetime.now()
+        query = stale_query(now)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+
+        batch = list(users.find(query).sort("_id", 1).limit(batch_size))
+        if not batch:
+            jobs.update_one(
+                {"_id": JOB_ID},
+                {"$set": {"finished_at": now}, "$unset": {"last_id": ""}},
+                upsert=True
+            )
+            break
+
+        ids = [doc["_id"] for doc in batch]
+        _archive(batch, now)
+        jobs.update_one(
+            {"_id": JOB_ID},
+            {"$set": {"pending": ids, "last_id": ids[-1], "updated_at": now}},
+            upsert=True
+        )
+        users.delete_many({"$and": [{"_id": {"$in": ids}}, stale_query(now)]})
+        moved = _prune(ids)
+        jobs.update_one({"_id": JOB_ID}, {"$unset": {"pending": ""}, "$inc": {"moved": moved}})
+
+        moved_total += moved
+        last_id = ids[-1]
+        batches += 1
+        elapsed = time.monotonic() - started
+        logger.info("Compaction batch up to %s: moved %s of %s in %.2fs", last_id, moved, len(ids), elapsed)
+        # Чем тяжелее была пачка, тем дольше отдыхаем
+        time.sleep(max(pause, elapsed * WORK_PAUSE_RATIO))
+
+    return moved_total
+
+
+def restore_profile(user_id):
+    """Возвращает неактивную анкету из архива в users, если она там есть"""
+    doc = archived_profiles.find_one_and_delete({"_id": user_id})
+    if not doc:
+        return None
+    doc.pop("archived_at", None)
+    doc["last_active"] = datetime.now()
+    _drop_deleted_ids(doc)
+    users.replace_one({"_id": user_id}, doc, upsert=True)
+    _restore_likes(doc)
+    return doc
+
+
+def _drop_deleted_ids(doc):
+    """Убирает из связей анкеты id, удалённые, пока она лежала в архиве"""
+    ids = list({i for field in GRAPH_FIELDS for i in doc.get(field) or []})
+    if not ids:
+        return
+    alive = {d["_id"] for d in users.find({"_id": {"$in": ids}}, {"_id": 1})}
+    alive |= {d["_id"] for d in archived_profiles.find({"_id": {"$in": ids}}, {"_id": 1})}
+    for field in GRAPH_FIELDS:
+        if field in doc:
+            doc[field] = [i for i in doc[field] if i in alive]
+
+
+def _restore_likes(doc):
+    """Восстанавливает встречные лайки, если их вычистили при архивации"""
+    from pymongo import UpdateMany
+    requests = []
+    if doc.get("liked"):
+        requests.append(UpdateMany({"_id": {"$in": doc["liked"]}}, {"$addToSet": {"liked_by": doc["_id"]}}))
+    if doc.get("liked_by"):
+        requests.append(UpdateMany({"_id": {"$in": doc["liked_by"]}}, {"$addToSet": {"liked": doc["_id"]}}))
+    if requests:
+        users.bulk_write(requests, ordered=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Уплотнение коллекции users")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=BATCH_PAUSE)
+    parser.add_argument("--max-batches", type=int)
+    parser.add_argument("--ignore-peak", action="store_true", help="Работать и в часы пик")
+    parser.add_argument("--forever", action="store_true")
+    parser.add_argument("--interval", type=float, default=3600)
+    args = parser.parse_args(argv)
+
+    import logs
+    logs.setup_logging()
+
+    peak_hours = () if args.ignore_peak else PEAK_HOURS
+    while True:
+        moved = compact(args.batch_size, args.pause, peak_hours, args.max_batches)
+        logger.info("Compaction pass finished: moved %s profiles", moved)
+        if not args.forever:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
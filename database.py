@@ -1,6 +1,99 @@
-from pymongo import MongoClient
+import os
+import threading
 
-client = MongoClient("mongodb://localhost:27017/")
-db = client.dating_bot
-users = db.users
-old_profiles = db.old_profiles
+import metrics
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+DB_NAME = os.getenv("MONGO_DB", "dating_bot")
+
+# find() замеряется отдельно: сам вызов только создаёт курсор, запрос идёт при чтении
+DB_METHODS = [
+    "find_one", "update_one", "update_many", "insert_one", "replace_one",
+    "delete_many", "bulk_write", "find_one_and_delete", "find_one_and_update",
+    "count_documents"
+]
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_db():
+    """База данных; pymongo импортируется и клиент создаётся при первом обращении"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from pymongo import MongoClient
+                _client = MongoClient(MONGO_URI)
+    return _client[DB_NAME]
+
+
+def instrument(collection, name):
+    """Метрики времени запросов для коллекции"""
+    metrics.instrument_methods(collection, DB_METHODS, metrics.DB_LATENCY, f"{name}.", errors=metrics.DB_ERRORS)
+    return metrics.instrument_find(collection, metrics.DB_LATENCY, f"{name}.", errors=metrics.DB_ERRORS)
+
+
+class LazyCollection:
+    """Коллекция, которая подключается к MongoDB только при первом запросе"""
+
+    def __init__(self, name):
+        self._name = name
+        self._collection = None
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        with self._lock:
+            if self._collection is None:
+                self._collection = instrument(get_db()[self._name], self._name)
+        return self._collection
+
+    def _reset(self):
+        with self._lock:
+            self._collection = None
+            # Убираем закешированные методы старого клиента
+            for attr in [a for a in self.__dict__ if not a.startswith("_")]:
+                del self.__dict__[attr]
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        collection = self._collection
+        if collection is None:
+            collection = self._resolve()
+        value = getattr(collection, attr)
+        if callable(value):
+            # Кешируем метод, чтобы следующие вызовы шли мимо __getattr__
+            self.__dict__[attr] = value
+        return value
+
+
+users = LazyCollection("users")
+old_profiles = LazyCollection("old_profiles")
+archived_profiles = LazyCollection("archived_profiles")
+jobs = LazyCollection("jobs")
+
+
+def ensure_indexes():
+    """Индексы для поиска по слоям активности и графа лайков; create_index идемпотентен"""
+    from pymongo import ASCENDING, DESCENDING
+    users.create_index([("gender", ASCENDING), ("last_active", DESCENDING)])
+    users.create_index([("last_active", DESCENDING)])
+    # Мультиключевые индексы для $pull в compaction и выборки совпадений.
+    # На viewed индекса нет: массив растёт с каждым свайпом, и индекс
+    # дорого обходился бы на записи, поэтому compaction делает паузы по
+    # затраченному времени.
+    users.create_index([("liked", ASCENDING)])
+    users.create_index([("liked_by", ASCENDING)])
+
+
+def close():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+    for collection in (users, old_profiles, archived_profiles, jobs):
+        # Бенчмарки подменяют коллекции обычными, их сбрасывать не нужно
+        if isinstance(collection, LazyCollection):
+            collection._reset()
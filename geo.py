@@ -0,0 +1,134 @@
+from math import asin, cos, degrees, pi, radians, sin, sqrt
+from typing import NamedTuple, Optional
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = pi * EARTH_RADIUS_KM / 180
+
+# Равнопромежуточная проекция даёт ошибку < 0.5% на расстояниях до ~100 км
+# вне приполярных широт и обходится одним косинусом вместо гаверсинуса.
+FAST_PATH_MAX_DEGREES = 1.0
+FAST_PATH_MAX_LATITUDE = 70.0
+
+
+class Coordinates(NamedTuple):
+    """Проверенные координаты в градусах; создавать через parse() или from_location()"""
+    lat: float
+    lon: float
+
+    @classmethod
+    def parse(cls, lat, lon):
+        lat = float(lat)
+        lon = float(lon)
+        if not -90 <= lat <= 90:
+            raise ValueError(f"Latitude out of bounds: {lat}")
+        if not -180 <= lon <= 180:
+            raise ValueError(f"Longitude out of bounds: {lon}")
+        return cls(lat, lon)
+
+    @classmethod
+    def from_location(cls, location) -> Optional["Coordinates"]:
+        """Координаты из поля location анкеты или None, если их нет или они некорректны"""
+        if not location:
+            return None
+        try:
+            return cls.parse(location.get("latitude", 0), location.get("longitude", 0))
+        except (TypeError, ValueError):
+            return None
+
+
+def haversine(a: Coordinates, b: Coordinates) -> float:
+    """Расстояние по большому кругу в км"""
+    lat1, lat2 = radians(a.lat), radians(b.lat)
+    dlat = lat2 - lat1
+    dlon = radians(b.lon - a.lon)
+    h = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(h)))
+
+
+def distance(a: Coordinates, b: Coordinates) -> float:
+    """Расстояние в км: равнопромежуточная проекция для близких точек, гаверсинус для остальных"""
+    lat1, lon1 = a
+    lat2, lon2 = b
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    if (-FAST_PATH_MAX_DEGREES < dlat < FAST_PATH_MAX_DEGREES and -FAST_PATH_MAX_DEGREES < dlon < FAST_PATH_MAX_DEGREES
+            and -FAST_PATH_MAX_LATITUDE < lat1 < FAST_PATH_MAX_LATITUDE):
+        x = dlon * cos(radians(lat1 + dlat / 2))
+        return KM_PER_DEGREE * sqrt(x * x + dlat * dlat)
+    return haversine(a, b)
+
+
+_numpy = None
+
+
+def numpy():
+    """numpy импортируется при первом пакетном расчёте; None, если не установлен"""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy as np
+        except ImportError:  # numpy необязателен, без него distances() считает в цикле
+            np = False
+        _numpy = np
+    return _numpy or None
+
+
+def distances(origin: Coordinates, lats, lons):
+    """Расстояния в км от origin до каждой точки (lats[i], lons[i])
+
+    С numpy возвращает ndarray и считает гаверсинус векторно, иначе — список.
+    """
+    np = numpy()
+    if np is not None:
+        lat1 = radians(origin.lat)
+        lat2 = np.radians(np.asarray(lats, dtype=float))
+        dlon = np.radians(np.asarray(lons, dtype=float)) - radians(origin.lon)
+        h = np.sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(h)))
+
+    lat1 = radians(origin.lat)
+    cos_lat1 = cos(lat1)
+    lon1 = radians(origin.lon)
+    result = []
+    for lat, lon in zip(lats, lons):
+        lat2 = radians(lat)
+        h = sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * cos(lat2) * sin((radians(lon) - lon1) / 2) ** 2
+        result.append(2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(h))))
+    return result
+
+
+def bounding_box(origin: Coordinates, radius_km: float):
+    """Диапазоны широт и долгот, заведомо покрывающие круг радиуса radius_km
+
+    Возвращает (min_lat, max_lat, [(min_lon, max_lon), ...]); долготных
+    диапазонов два, если круг пересекает 180-й меридиан.
+    """
+    dlat = degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = origin.lat - dlat, origin.lat + dlat
+    if min_lat <= -90 or max_lat >= 90:
+        # Круг накрывает полюс — подходят все долготы
+        return max(min_lat, -90.0), min(max_lat, 90.0), [(-180.0, 180.0)]
+
+    dlon = degrees(asin(min(1.0, sin(radius_km / EARTH_RADIUS_KM) / cos(radians(origin.lat)))))
+    min_lon, max_lon = origin.lon - dlon, origin.lon + dlon
+    if min_lon < -180:
+        return min_lat, max_lat, [(min_lon + 360, 180.0), (-180.0, max_lon)]
+    if max_lon > 180:
+        return min_lat, max_lat, [(min_lon, 180.0), (-180.0, max_lon - 360)]
+    return min_lat, max_lat, [(min_lon, max_lon)]
+
+
+def bounding_box_query(origin: Coordinates, radius_km: float, field="location"):
+    """Фильтр MongoDB по bounding_box для полей <field>.latitude/<field>.longitude"""
+    min_lat, max_lat, lon_ranges = bounding_box(origin, radius_km)
+    lat_field, lon_field = f"{field}.latitude", f"{field}.longitude"
+    query = {lat_field: {"$gte": min_lat, "$lte": max_lat}}
+    if len(lon_ranges) == 1:
+        min_lon, max_lon = lon_ranges[0]
+        query[lon_field] = {"$gte": min_lon, "$lte": max_lon}
+    else:
+        # Через 180-й меридиан: исключаем промежуток между диапазонами, без $or,
+        # чтобы фильтр можно было смешивать с другими условиями запроса
+        (gap_end, _), (_, gap_start) = lon_ranges
+        query[lon_field] = {"$gte": -180.0, "$not": {"$gt": gap_start, "$lt": gap_end}}
+    return query
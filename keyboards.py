@@ -0,0 +1,157 @@
+import json
+from telebot import types
+
+import callbacks
+
+GENDERS = ["Мужчина", "Женщина"]
+TARGETS = ["Мужчину", "Женщину", "Не важно"]
+HOBBIES = [
+    "🎵 Музыка", "🎮 Игры", "📚 Чтение", "🏃 Спорт", "🎨 Искусство",
+    "🍳 Кулинария", "✈️ Путешествия", "🎥 Кино", "🐶 Животные",
+    "💻 Программирование", "🌳 Природа", "🏋️ Фитнес", "📷 Фото"
+]
+MAIN_MENU = ["🔍 Начать поиск", "❤️ Мои совпадения", "✏️ Редактировать профиль"]
+EDIT_ITEMS = [
+    "✏️ Изменить имя",
+    "✏️ Изменить фото",
+    "✏️ Изменить описание",
+    "✏️ Изменить увлечения"
+]
+HOBBIES_DONE = "✅ Готово"
+HOBBY_CHECKMARK = "✔️ "
+HOBBIES_ROW_WIDTH = 2
+
+# Реестр статических клавиатур: имя -> функция сборки.
+# Каждая клавиатура собирается один раз, дальше отдаётся готовый JSON,
+# который telebot передаёт в API без повторной сериализации.
+_builders = {}
+_cache = {}
+
+
+def static(name):
+    """Регистрирует функцию сборки статической клавиатуры"""
+    def decorator(build):
+        _builders[name] = build
+        return build
+    return decorator
+
+
+def get(name):
+    """Возвращает сериализованную клавиатуру, собирая её при первом обращении"""
+    markup = _cache.get(name)
+    if markup is None:
+        markup = _cache[name] = _builders[name]().to_json()
+    return markup
+
+
+@static("remove")
+def _remove():
+    return types.ReplyKeyboardRemove()
+
+
+@static("genders")
+def _genders():
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    markup.add(*GENDERS)
+    return markup
+
+
+@static("targets")
+def _targets():
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    markup.add(*TARGETS)
+    return markup
+
+
+@static("main_menu")
+def _main_menu():
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    markup.add(*MAIN_MENU)
+    return markup
+
+
+@static("location")
+def _location():
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    markup.add(types.KeyboardButton("📍 Отправить локацию", request_location=True))
+    return markup
+
+
+@static("phone_verification")
+def _phone_verification():
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    phone_btn = types.KeyboardButton("📱 Отправить номер телефона", request_contact=True)
+    skip_btn = types.KeyboardButton("🚫 Пропустить верификацию")
+    markup.add(phone_btn, skip_btn)
+    return markup
+
+
+@static("edit_profile")
+def _edit_profile():
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    markup.add(*EDIT_ITEMS, "📱 Пройти верификацию", "◀️ Назад")
+    return markup
+
+
+@static("edit_profile_verified")
+def _edit_profile_verified():
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    markup.add(*EDIT_ITEMS, "◀️ Назад")
+    return markup
+
+
+def edit_profile_markup(verified):
+    return get("edit_profile_verified" if verified else "edit_profile")
+
+
+# Шаблоны параметризованных клавиатур. Кнопки сериализуются один раз,
+# а под конкретного пользователя собирается только внешний массив.
+
+def _button_json(text, callback_data):
+    return json.dumps({"text": text, "callback_data": callback_data}, ensure_ascii=False)
+
+
+_HOBBY_BUTTONS = [
+    (
+        _button_json(hobby, callbacks.encode(callbacks.HOBBY, i)),
+        _button_json(HOBBY_CHECKMARK + hobby, callbacks.encode(callbacks.HOBBY, i))
+    )
+    for i, hobby in enumerate(HOBBIES)
+]
+_HOBBIES_DONE_ROW = "[" + _button_json(HOBBIES_DONE, callbacks.encode(callbacks.HOBBIES_DONE)) + "]"
+
+
+def hobbies_markup(selected):
+    """Инлайн-клавиатура выбора увлечений с отметками выбранных"""
+    selected = set(selected)
+    buttons = [
+        _HOBBY_BUTTONS[i][hobby in selected]
+        for i, hobby in enumerate(HOBBIES)
+    ]
+    rows = [
+        "[" + ",".join(buttons[i:i + HOBBIES_ROW_WIDTH]) + "]"
+        for i in range(0, len(buttons), HOBBIES_ROW_WIDTH)
+    ]
+    rows.append(_HOBBIES_DONE_ROW)
+    return '{"inline_keyboard":[' + ",".join(rows) + "]}"
+
+
+_LIKE, _DISLIKE, _REPORT = "{like}", "{dislike}", "{report}"
+_PROFILE_TEMPLATE = (
+    '{"inline_keyboard":[['
+    + _button_json("👍", _LIKE) + ","
+    + _button_json("👎", _DISLIKE)
+    + "],["
+    + _button_json("⚠️ Пожаловаться", _REPORT)
+    + "]]}"
+)
+
+
+def profile_markup(chat_id, profile_id):
+    """Инлайн-клавиатура лайк/дизлайк/жалоба для анкеты, подписанная для chat_id"""
+    return (
+        _PROFILE_TEMPLATE
+        .replace(_LIKE, callbacks.encode(callbacks.LIKE, profile_id, chat_id))
+        .replace(_DISLIKE, callbacks.encode(callbacks.DISLIKE, profile_id, chat_id))
+        .replace(_REPORT, callbacks.encode(callbacks.REPORT, profile_id, chat_id))
+    )
@@ -0,0 +1,195 @@
+import atexit
+import copy
+import functools
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json или text
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Ограничение повторяющихся сообщений: первые RATE_LIMIT_BURST записей
+# за окно пишутся как есть, дальше только каждая RATE_LIMIT_SAMPLE-я.
+RATE_LIMIT_WINDOW = float(os.getenv("LOG_RATE_LIMIT_WINDOW", "60"))
+RATE_LIMIT_BURST = int(os.getenv("LOG_RATE_LIMIT_BURST", "20"))
+RATE_LIMIT_SAMPLE = int(os.getenv("LOG_RATE_LIMIT_SAMPLE", "100"))
+LOG_QUEUE_SIZE = 10000
+
+_context = threading.local()
+_listener = None
+
+
+def bind(chat_id=None, handler=None):
+    """Задаёт chat_id и имя обработчика для логов текущего потока"""
+    _context.chat_id = chat_id
+    _context.handler = handler
+
+
+def _chat_id_of(update):
+    """chat_id из Message, CallbackQuery или самого chat_id"""
+    if isinstance(update, int):
+        return update
+    message = getattr(update, "message", update)
+    chat = getattr(message, "chat", None)
+    return getattr(chat, "id", None)
+
+
+def contextual(handler):
+    """Декоратор обработчика: все записи внутри него получают chat_id и handler"""
+    name = handler.__name__
+
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        previous = (getattr(_context, "chat_id", None), getattr(_context, "handler", None))
+        bind(_chat_id_of(args[0]) if args else None, name)
+        try:
+            return handler(*args, **kwargs)
+        finally:
+            bind(*previous)
+
+    return wrapper
+
+
+class ContextFilter(logging.Filter):
+    """Добавляет в запись контекст обработчика из потока, в котором она создана"""
+
+    def filter(self, record):
+        if not hasattr(record, "chat_id"):
+            record.chat_id = getattr(_context, "chat_id", None)
+        if not hasattr(record, "handler"):
+            record.handler = getattr(_context, "handler", None)
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Ограничивает и сэмплирует повторяющиеся сообщения с одного места вызова"""
+
+    def __init__(self, window=RATE_LIMIT_WINDOW, burst=RATE_LIMIT_BURST, sample=RATE_LIMIT_SAMPLE):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.sample = sample
+        self._lock = threading.Lock()
+        self._state = {}  # ключ -> [начало окна, записей в окне, подавлено]
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+
+        key = (record.name, record.levelno, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                self._state[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+
+            state[1] += 1
+            if state[1] <= self.burst or state[1] % self.sample == 0:
+                if state[2]:
+                    record.suppressed, state[2] = state[2], 0
+                return True
+
+            state[2] += 1
+            return False
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in ("chat_id", "handler", "suppressed"):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Запись из очереди: трейсбек уже отформатирован в prepare()
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        text = super().format(record)
+        if getattr(record, "suppressed", None):
+            text += f" (пропущено похожих сообщений: {record.suppressed})"
+        return text
+
+
+_traceback_formatter = logging.Formatter()
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """Не блокирует обработчик, если поток вывода не успевает: запись отбрасывается"""
+
+    def prepare(self, record):
+        """Подставляет аргументы в сообщение, но трейсбек оставляет отдельно в exc_text.
+
+        Стандартный prepare() склеивает трейсбек с сообщением, и JsonFormatter
+        уже не может вывести его отдельным полем.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None):
+    """Настраивает корневой логгер: фильтры в потоке обработчика, вывод в отдельном потоке"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter(TEXT_FORMAT))
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = _DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter())
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def shutdown_logging():
+    """Дописывает оставшиеся в очереди записи и останавливает поток вывода"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
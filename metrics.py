@@ -0,0 +1,246 @@
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+# Эндпоинт /metrics слушает только локальный интерфейс; 9100 занят node_exporter
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9471"))
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_latency_seconds",
+    "Время выполнения обработчиков бота",
+    ["handler"]
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total",
+    "Ошибки в обработчиках бота: необработанные исключения и ошибки, залогированные самим обработчиком",
+    ["handler"]
+)
+SPAN_LATENCY = Histogram(
+    "bot_span_latency_seconds",
+    "Время выполнения отдельных этапов внутри обработчиков",
+    ["span"]
+)
+DB_LATENCY = Histogram(
+    "bot_db_latency_seconds",
+    "Время выполнения запросов к MongoDB",
+    ["operation"],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+)
+DB_ERRORS = Counter(
+    "bot_db_errors_total",
+    "Ошибки запросов к MongoDB",
+    ["operation"]
+)
+TELEGRAM_LATENCY = Histogram(
+    "bot_telegram_latency_seconds",
+    "Время выполнения вызовов Telegram API",
+    ["method"]
+)
+TELEGRAM_ERRORS = Counter(
+    "bot_telegram_errors_total",
+    "Ошибки вызовов Telegram API",
+    ["method"]
+)
+SEND_RETRIES = Counter(
+    "bot_send_message_retries_total",
+    "Повторные попытки в safe_bot_send_message"
+)
+SEND_FAILURES = Counter(
+    "bot_send_message_failures_total",
+    "Сообщения, не доставленные после всех попыток"
+)
+USER_DATA_SIZE = Gauge(
+    "bot_user_data_size",
+    "Количество пользователей с незавершённым состоянием в user_data"
+)
+RATE_LIMIT_ENTRIES = Gauge(
+    "bot_rate_limit_entries",
+    "Количество записей в user_last_request"
+)
+WORKER_QUEUE_DEPTH = Gauge(
+    "bot_worker_queue_depth",
+    "Количество апдейтов в очереди пула обработчиков"
+)
+STARTUP_SECONDS = Gauge(
+    "bot_startup_seconds",
+    "Время от старта процесса до начала опроса Telegram"
+)
+TIME_TO_FIRST_UPDATE = Gauge(
+    "bot_time_to_first_update_seconds",
+    "Время от старта процесса до обработки первого апдейта"
+)
+CAMPAIGN_MESSAGES = Counter(
+    "bot_campaign_messages_total",
+    "Сообщения массовых рассылок по результату отправки",
+    ["result"]
+)
+
+
+_current = threading.local()  # Обработчик, который выполняется в этом потоке
+
+
+def instrumented(handler):
+    """Декоратор обработчика: гистограмма времени и счётчик ошибок"""
+    # Дочерние метрики берём один раз, чтобы не искать лейблы на каждом вызове
+    name = handler.__name__
+    latency = HANDLER_LATENCY.labels(name)
+    errors = HANDLER_ERRORS.labels(name)
+
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        previous = getattr(_current, "handler", None)
+        _current.handler = name
+        start = time.perf_counter()
+        try:
+            return handler(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - start)
+            _current.handler = previous
+
+    return wrapper
+
+
+class HandledErrorCounter(logging.Filter):
+    """Фильтр логгера, который считает записи ERROR внутри обработчиков.
+
+    Обработчики ловят Exception и логируют ошибку сами, поэтому без этого
+    bot_handler_errors_total не растёт, например, при недоступной MongoDB.
+    """
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR:
+            handler = getattr(_current, "handler", None)
+            if handler is not None:
+                HANDLER_ERRORS.labels(handler).inc()
+        return True
+
+
+@contextmanager
+def span(name):
+    """Замер отдельного этапа: with metrics.span("search_scan"): ..."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        SPAN_LATENCY.labels(name).observe(time.perf_counter() - start)
+
+
+def instrument_methods(obj, methods, histogram, prefix="", errors=None):
+    """Подменяет методы объекта обёртками, замеряющими время вызова"""
+    for name in methods:
+        method = getattr(obj, name)
+        label = prefix + name
+        setattr(obj, name, _timed(method, histogram.labels(label), errors.labels(label) if errors else None))
+    return obj
+
+
+def _timed(method, latency, errors):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            if errors is not None:
+                errors.inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+class TimedCursor:
+    """Курсор find(), у которого замеряется выполнение запроса, а не создание.
+
+    Время суммируется по всем next() (первый запрос и getMore) и
+    записывается один раз, когда курсор дочитан или закрыт.
+    """
+
+    def __init__(self, cursor, latency, errors=None):
+        self._cursor = cursor
+        self._latency = latency
+        self._errors = errors
+        self._elapsed = 0.0
+        self._observed = False
+
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def chained(*args, **kwargs):
+            # sort(), limit() и т.п. возвращают сам курсор — оставляем обёртку
+            result = attr(*args, **kwargs)
+            return self if result is self._cursor else result
+
+        return chained
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            doc = next(self._cursor)
+        except StopIteration:
+            self._elapsed += time.perf_counter() - start
+            self._observe()
+            raise
+        except Exception:
+            if self._errors is not None:
+                self._errors.inc()
+            raise
+        self._elapsed += time.perf_counter() - start
+        return doc
+
+    def close(self):
+        self._observe()
+        self._cursor.close()
+
+    def _observe(self):
+        if not self._observed:
+            self._observed = True
+            self._latency.observe(self._elapsed)
+
+
+def instrument_find(obj, histogram, prefix="", errors=None):
+    """Подменяет find() так, чтобы замерялось чтение результатов"""
+    find = obj.find
+    latency = histogram.labels(prefix + "find")
+    find_errors = errors.labels(prefix + "find") if errors else None
+
+    @functools.wraps(find)
+    def wrapper(*args, **kwargs):
+        return TimedCursor(find(*args, **kwargs), latency, find_errors)
+
+    obj.find = wrapper
+    return obj
+
+
+def track_state(user_data, user_last_request, bot):
+    """Гейджи, которые вычисляются только в момент чтения /metrics"""
+    USER_DATA_SIZE.set_function(lambda: len(user_data))
+    RATE_LIMIT_ENTRIES.set_function(lambda: len(user_last_request))
+    WORKER_QUEUE_DEPTH.set_function(lambda: _queue_depth(bot))
+
+
+def _queue_depth(bot):
+    pool = getattr(bot, "worker_pool", None)
+    tasks = getattr(pool, "tasks", None)
+    return tasks.qsize() if tasks is not None else 0
+
+
+def serve(host=METRICS_HOST, port=METRICS_PORT):
+    """Запускает HTTP-эндпоинт /metrics в фоновом потоке"""
+    start_http_server(port, addr=host)
@@ -0,0 +1,48 @@
+import sys
+import types
+
+import pytest
+
+
+def _install_config():
+    """Тестовый config.py, если настоящего нет"""
+    try:
+        import config  # noqa: F401
+    except ImportError:
+        config = types.ModuleType("config")
+        config.TOKEN = "123456:TEST-TOKEN"
+        config.ADMIN_ID = 1
+        config.AGREEMENT_URL = "https://example.com/agreement"
+        config.PRIVACY_URL = "https://example.com/privacy"
+        sys.modules["config"] = config
+
+
+def _patch_mongomock_bulk():
+    """mongomock не понимает аргумент sort, который pymongo 4.x передаёт в bulk_write"""
+    from mongomock.collection import BulkOperationBuilder
+    if getattr(BulkOperationBuilder, "_without_sort", False):
+        return
+    BulkOperationBuilder._without_sort = True
+    for name in ("add_replace", "add_update"):
+        method = getattr(BulkOperationBuilder, name)
+
+        def without_sort(self, *args, _method=method, sort=None, **kwargs):
+            return _method(self, *args, **kwargs)
+
+        setattr(BulkOperationBuilder, name, without_sort)
+
+
+_install_config()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """Пустая база mongomock вместо MongoDB для всех коллекций database"""
+    mongomock = pytest.importorskip("mongomock")
+    _patch_mongomock_bulk()
+    import database
+    database.close()
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(database, "_client", client)
+    yield client[database.DB_NAME]
+    database.close()
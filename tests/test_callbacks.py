@@ -0,0 +1,67 @@
+import pytest
+
+import callbacks
+
+CHAT_ID = 123456789
+
+
+@pytest.fixture(autouse=True)
+def secret():
+    callbacks.set_secret("123456:TEST-TOKEN")
+
+
+@pytest.mark.parametrize("code, value", [
+    (callbacks.LIKE, 1_000_000_000),
+    (callbacks.DISLIKE, 7),
+    (callbacks.REPORT, 0),
+    (callbacks.HOBBY, 12),
+    (callbacks.HOBBIES_DONE, 0),
+])
+def test_round_trip(code, value):
+    data = callbacks.encode(code, value, CHAT_ID)
+    assert len(data.encode()) <= callbacks.MAX_CALLBACK_DATA
+    assert callbacks.decode(data, CHAT_ID) == (callbacks._actions[code][0], code, value)
+
+
+@pytest.mark.parametrize("value", [0, 1, 61, 62, 2 ** 63, -5])
+def test_base62_round_trip(value):
+    assert callbacks.from_base62(callbacks.to_base62(value)) == value
+
+
+def test_signature_is_bound_to_chat():
+    data = callbacks.encode(callbacks.LIKE, 42, CHAT_ID)
+    with pytest.raises(callbacks.CallbackError):
+        callbacks.decode(data, CHAT_ID + 1)
+
+
+def test_forged_value_is_rejected():
+    data = callbacks.encode(callbacks.LIKE, 42, CHAT_ID)
+    signature = data[-callbacks.SIGNATURE_LENGTH:]
+    forged = callbacks.VERSION + callbacks.LIKE + callbacks.to_base62(43) + signature
+    with pytest.raises(callbacks.CallbackError):
+        callbacks.decode(forged, CHAT_ID)
+
+
+def test_signature_depends_on_secret():
+    data = callbacks.encode(callbacks.REPORT, 42, CHAT_ID)
+    callbacks.set_secret("654321:OTHER-TOKEN")
+    with pytest.raises(callbacks.CallbackError):
+        callbacks.decode(data, CHAT_ID)
+
+
+@pytest.mark.parametrize("data", [
+    "",
+    "1",
+    "2l1abcdefgh",  # неизвестная версия
+    "1z1",  # неизвестное действие
+    "1h!",  # не base62
+    "1l",  # нет ни значения, ни подписи
+    "like_1234567890",  # старый формат
+])
+def test_malformed_data_is_rejected(data):
+    with pytest.raises(callbacks.CallbackError):
+        callbacks.decode(data, CHAT_ID)
+
+
+def test_unsigned_action_needs_no_chat():
+    assert callbacks.decode(callbacks.encode(callbacks.HOBBY, 3), None).value == 3
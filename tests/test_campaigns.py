@@ -0,0 +1,187 @@
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+from telebot.apihelper import ApiTelegramException
+
+import campaigns
+
+
+def telegram_error(code, description, **parameters):
+    result = {"ok": False, "error_code": code, "description": description}
+    if parameters:
+        result["parameters"] = parameters
+    return ApiTelegramException("sendMessage", None, result)
+
+
+class FakeBot:
+    def __init__(self, errors=None, on_send=None):
+        self.sent = Counter()
+        self.errors = errors or {}
+        self.on_send = on_send
+        self._lock = threading.Lock()
+
+    def send_message(self, chat_id, text, **kwargs):
+        if self.on_send:
+            self.on_send(chat_id)
+        error = self.errors.get(chat_id)
+        if error is not None:
+            raise error
+        with self._lock:
+            self.sent[chat_id] += 1
+
+
+@pytest.fixture(autouse=True)
+def stopping(monkeypatch):
+    event = threading.Event()
+    monkeypatch.setattr(campaigns, "_stopping", event)
+    return event
+
+
+@pytest.fixture
+def recipients(db):
+    db.users.insert_many([{"_id": i, "name": f"user{i}"} for i in range(1, 21)])
+    return set(range(1, 21))
+
+
+def run(bot, campaign_id, **kwargs):
+    return campaigns.run(bot, campaign_id, rate=10000, batch_size=5, **kwargs)
+
+
+def job(db, campaign_id):
+    return db.jobs.find_one({"_id": campaigns._job_id(campaign_id)})
+
+
+def test_resumes_from_last_id_after_crash(db, recipients, monkeypatch):
+    campaign_id = campaigns.create("all", "Привет, {name}")
+    render = campaigns.render
+
+    def crash_on_12(text, doc, fields):
+        if doc["_id"] == 12:
+            raise RuntimeError("process killed")
+        return render(text, doc, fields)
+
+    bot = FakeBot()
+    with monkeypatch.context() as patched:
+        patched.setattr(campaigns, "render", crash_on_12)
+        with pytest.raises(RuntimeError):
+            run(bot, campaign_id)
+
+    state = job(db, campaign_id)
+    assert state["last_id"] == 10 and state["delivered"] == 10
+    assert "owner" not in state
+
+    state = run(bot, campaign_id)
+
+    assert state["status"] == campaigns.FINISHED
+    assert state["delivered"] == len(recipients)
+    assert set(bot.sent) == recipients
+    # Повторно уходит не больше одной пачки
+    assert sum(count - 1 for count in bot.sent.values()) <= 5
+
+
+def test_second_owner_waits_for_lease(db, recipients):
+    campaign_id = campaigns.create("all", "Привет")
+    job_id = campaigns._job_id(campaign_id)
+    db.jobs.update_one({"_id": job_id}, {"$set": {
+        "owner": "other-host:1:abc", "lease_until": datetime.now() + timedelta(minutes=5)
+    }})
+
+    assert campaigns._acquire(job_id) is None
+    bot = FakeBot()
+    state = run(bot, campaign_id)
+    assert state["status"] == campaigns.RUNNING and not bot.sent
+
+    # Чужой процесс упал, аренда истекла
+    db.jobs.update_one({"_id": job_id}, {"$set": {"lease_until": datetime.now() - timedelta(seconds=1)}})
+    state = run(bot, campaign_id)
+
+    assert state["status"] == campaigns.FINISHED
+    assert set(bot.sent) == recipients and max(bot.sent.values()) == 1
+
+
+def test_lost_lease_stops_sender(db, recipients):
+    campaign_id = campaigns.create("all", "Привет")
+    job_id = campaigns._job_id(campaign_id)
+
+    def steal(chat_id):
+        if chat_id == 8:
+            db.jobs.update_one({"_id": job_id}, {"$set": {"owner": "other-host:1:abc"}})
+
+    bot = FakeBot(on_send=steal)
+    state = run(bot, campaign_id)
+
+    assert state["status"] == campaigns.RUNNING
+    assert state["owner"] == "other-host:1:abc"
+    assert state["last_id"] == 5 and state["delivered"] == 5
+    assert max(bot.sent) <= 10
+
+
+def test_blocked_users_are_marked(db, recipients):
+    campaign_id = campaigns.create("all", "Привет")
+    bot = FakeBot(errors={
+        3: telegram_error(403, "Forbidden: bot was blocked by the user"),
+        7: telegram_error(400, "Bad Request: chat not found"),
+    })
+
+    state = run(bot, campaign_id)
+
+    assert state["blocked"] == 2 and state["delivered"] == len(recipients) - 2
+    assert {doc["_id"] for doc in db.users.find({"blocked_bot": True})} == {3, 7}
+    # Следующая рассылка их уже не выбирает
+    second = campaigns.create("all", "Ещё раз", now=datetime.now() + timedelta(seconds=1))
+    assert run(FakeBot(), second)["delivered"] == len(recipients) - 2
+
+
+def test_flood_wait_extends_lease(db, recipients):
+    campaign_id = campaigns.create("all", "Привет")
+    job_id = campaigns._job_id(campaign_id)
+    flooded_at = []
+    leases = []
+
+    def flood_once(chat_id):
+        if chat_id == 4 and not flooded_at:
+            flooded_at.append(datetime.now())
+            raise telegram_error(429, "Too Many Requests", retry_after=1)
+        leases.append(job(db, campaign_id).get("lease_until"))
+
+    bot = FakeBot(on_send=flood_once)
+    state = run(bot, campaign_id)
+
+    assert state["status"] == campaigns.FINISHED and state["delivered"] == len(recipients)
+    assert db.jobs.find_one({"_id": job_id, "owner": {"$exists": True}}) is None
+    # Аренда покрывает паузу retry_after, а не только обычный срок
+    expected = flooded_at[0] + timedelta(seconds=1 + campaigns.LEASE_SECONDS - 0.01)
+    assert max(lease for lease in leases if lease) >= expected
+
+
+def test_stop_interrupts_batch_without_checkpoint(db, recipients, stopping):
+    campaign_id = campaigns.create("all", "Привет")
+
+    def stop_at_8(chat_id):
+        if chat_id == 8:
+            stopping.set()
+
+    state = campaigns.run(FakeBot(on_send=stop_at_8), campaign_id, rate=20, batch_size=5, workers=1)
+
+    assert state["status"] == campaigns.RUNNING
+    assert state["last_id"] == 5 and state["delivered"] == 5
+    assert "owner" not in state
+
+
+def test_inactive_audience_includes_profiles_without_last_active(db):
+    now = datetime.now()
+    db.users.insert_many([
+        {"_id": 1, "last_active": now},
+        {"_id": 2, "last_active": now - timedelta(days=campaigns.INACTIVE_DAYS + 1)},
+        {"_id": 3},
+    ])
+    query = campaigns.AUDIENCES["inactive"].query(now)
+    assert {doc["_id"] for doc in db.users.find(query)} == {2, 3}
+
+
+def test_ids_created_in_the_same_second_are_unique(db):
+    now = datetime(2026, 1, 1, 12)
+    ids = [campaigns.create("all", "Привет", now=now) for _ in range(3)]
+    assert ids == ["20260101120000", "20260101120000-2", "20260101120000-3"]
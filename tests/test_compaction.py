@@ -0,0 +1,175 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+import compaction
+import database
+
+LONG_AGO = datetime.now() - timedelta(days=compaction.INACTIVE_DAYS + 30)
+
+
+def profile(user_id, **fields):
+    doc = {
+        "_id": user_id, "name": f"user{user_id}", "gender": "Мужчина", "age": 30, "height": 180,
+        "bio": "", "hobbies": [], "photo": "photo", "location": None,
+        "registered_at": LONG_AGO, "last_active": LONG_AGO,
+        "liked": [], "liked_by": [], "viewed": [],
+    }
+    doc.update(fields)
+    return doc
+
+
+def compact(**kwargs):
+    return compaction.compact(pause=0, peak_hours=(), **kwargs)
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    def get_chat(self, chat_id):
+        return SimpleNamespace(username=f"user{chat_id}")
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+    def answer_callback_query(self, callback_query_id, text=None, **kwargs):
+        self.sent.append((callback_query_id, text))
+
+
+@pytest.fixture
+def fake_bot(monkeypatch):
+    fake = FakeBot()
+    monkeypatch.setattr(bot, "bot", fake)
+    monkeypatch.setattr(bot, "user_data", {})
+    monkeypatch.setattr(bot, "user_last_request", bot.defaultdict(float))
+    monkeypatch.setattr(bot, "user_last_active_write", bot.defaultdict(float))
+    return fake
+
+
+def callback(chat_id):
+    return SimpleNamespace(
+        id="callback", message=SimpleNamespace(chat=SimpleNamespace(id=chat_id)),
+        from_user=SimpleNamespace(first_name="user", username=None)
+    )
+
+
+def test_registration_after_delete_survives_compaction(db, fake_bot):
+    db.users.insert_one(profile(1, deleted=True, deleted_at=datetime.now(), registered_at=datetime.now()))
+
+    bot.user_data[1] = {"name": "Новый", "gender": "Мужчина", "age": 25, "height": 175,
+                        "bio": "", "hobbies": ["🎵 Музыка"], "photo": "p", "location": None}
+    bot.save_profile_after_verification(1)
+    compact()
+
+    user = db.users.find_one({"_id": 1})
+    assert user is not None and "deleted" not in user and "deleted_at" not in user
+
+
+def test_restore_drops_ids_deleted_while_archived(db):
+    db.users.insert_many([
+        profile(1, liked=[2, 3], liked_by=[2], viewed=[2, 3]),
+        profile(2, liked=[1], liked_by=[1], last_active=datetime.now()),
+        profile(3, liked_by=[1], last_active=datetime.now()),
+    ])
+    compact()
+    assert db.archived_profiles.find_one({"_id": 1})
+
+    # Пока 1 в архиве, 3 удаляет анкету
+    db.users.update_one({"_id": 3}, {"$set": {"deleted": True}})
+    compact()
+    assert db.old_profiles.find_one({"_id": 3})
+
+    restored = compaction.restore_profile(1)
+    assert restored["liked"] == [2] and restored["viewed"] == [2]
+    assert db.users.find_one({"_id": 1})["liked"] == [2]
+
+
+def test_any_action_restores_archived_profile(db, fake_bot):
+    db.users.insert_one(profile(1))
+    compact()
+    assert db.users.find_one({"_id": 1}) is None
+
+    assert bot.rate_limit_check(1)
+    assert db.users.find_one({"_id": 1})["last_active"] > LONG_AGO
+    assert db.archived_profiles.find_one({"_id": 1}) is None
+
+
+def test_like_from_archived_profile(db, fake_bot):
+    db.users.insert_many([profile(1), profile(2, last_active=datetime.now())])
+    compact()
+
+    bot.handle_like(callback(1), 2)
+
+    assert db.users.find_one({"_id": 1})["liked"] == [2]
+    assert db.users.find_one({"_id": 2})["liked_by"] == [1]
+    assert ("callback", "Лайк отправлен!") in fake_bot.sent
+
+
+def test_prune_keeps_edges_of_archived_and_drops_deleted(db):
+    db.users.insert_many([
+        profile(1),
+        profile(2, liked=[1, 3], liked_by=[1], viewed=[1, 3], last_active=datetime.now()),
+        profile(3, deleted=True),
+    ])
+
+    assert compact() == 2
+
+    assert db.archived_profiles.find_one({"_id": 1})
+    assert db.old_profiles.find_one({"_id": 3})
+    user = db.users.find_one({"_id": 2})
+    assert user["liked"] == [1] and user["liked_by"] == [1] and user["viewed"] == [1]
+
+
+def test_crash_with_pending_batch_is_finished_on_next_run(db, monkeypatch):
+    db.users.insert_many([
+        profile(2, liked=[3], viewed=[3], last_active=datetime.now()),
+        profile(3, deleted=True),
+    ])
+
+    def crash(ids):
+        raise RuntimeError("mongod went away")
+
+    with monkeypatch.context() as patched:
+        patched.setattr(compaction, "_prune", crash)
+        with pytest.raises(RuntimeError):
+            compact()
+
+    state = db.jobs.find_one({"_id": compaction.JOB_ID})
+    assert state["pending"] == [3] and state["last_id"] == 3
+    assert db.users.find_one({"_id": 2})["liked"] == [3]
+
+    compact()
+
+    assert db.users.find_one({"_id": 2})["liked"] == []
+    assert "pending" not in db.jobs.find_one({"_id": compaction.JOB_ID})
+
+
+def test_resumes_from_last_id(db):
+    db.users.insert_many([profile(i) for i in (10, 20, 30, 40)])
+
+    assert compact(batch_size=2, max_batches=1) == 2
+    assert db.jobs.find_one({"_id": compaction.JOB_ID})["last_id"] == 20
+
+    # Анкета ниже last_id появилась после первого прохода — продолжение её не трогает
+    db.users.insert_one(profile(5))
+    assert compact(batch_size=2) == 2
+    assert {doc["_id"] for doc in db.users.find()} == {5}
+
+    state = db.jobs.find_one({"_id": compaction.JOB_ID})
+    assert "last_id" not in state and state["moved"] == 4
+
+
+def test_restore_re_adds_reverse_likes(db):
+    db.users.insert_one(profile(2, last_active=datetime.now()))
+    # Анкета, заархивированная до того, как связи неактивных перестали вычищаться
+    db.archived_profiles.insert_one(dict(profile(1, liked=[2], liked_by=[2]), archived_at=LONG_AGO))
+
+    restored = compaction.restore_profile(1)
+
+    assert "archived_at" not in restored
+    user = db.users.find_one({"_id": 2})
+    assert user["liked"] == [1] and user["liked_by"] == [1]
+    assert bot.find_profile(1)["_id"] == 1
@@ -0,0 +1,54 @@
+import pytest
+from prometheus_client import REGISTRY
+
+import bot
+import metrics
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class BrokenCollection:
+    def find_one(self, *args, **kwargs):
+        raise RuntimeError("connection refused")
+
+    def find(self, *args, **kwargs):
+        return iter(self)
+
+    def __iter__(self):
+        raise RuntimeError("connection refused")
+        yield
+
+
+def test_db_errors_are_counted():
+    collection = BrokenCollection()
+    metrics.instrument_methods(collection, ["find_one"], metrics.DB_LATENCY, "broken.", errors=metrics.DB_ERRORS)
+    metrics.instrument_find(collection, metrics.DB_LATENCY, "broken.", errors=metrics.DB_ERRORS)
+    before_one = sample("bot_db_errors_total", operation="broken.find_one")
+    before_find = sample("bot_db_errors_total", operation="broken.find")
+
+    with pytest.raises(RuntimeError):
+        collection.find_one({})
+    with pytest.raises(RuntimeError):
+        list(collection.find({}))
+
+    assert sample("bot_db_errors_total", operation="broken.find_one") == before_one + 1
+    assert sample("bot_db_errors_total", operation="broken.find") == before_find + 1
+
+
+def test_handled_errors_are_counted_per_handler():
+    @metrics.instrumented
+    def handled_failure():
+        try:
+            raise RuntimeError("mongo is down")
+        except Exception as e:
+            bot.logger.error("Error in handled_failure: %s", e)
+
+    before = sample("bot_handler_errors_total", handler="handled_failure")
+    handled_failure()
+    assert sample("bot_handler_errors_total", handler="handled_failure") == before + 1
+
+    # Вне обработчика ошибки в счётчик не попадают
+    bot.logger.error("Outside of any handler")
+    assert sample("bot_handler_errors_total", handler="handled_failure") == before + 1
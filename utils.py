@@ -2,8 +2,6 @@ import logging
 from math import radians, cos, sin, asin, sqrt
 from typing import Tuple, Union
 
-# Настройка логгирования
-logging.basicConfig(level=logging.ERROR)
 logger = logging.getLogger(__name__)
 
 def parse_coordinates(coord: Union[str, float, int]) -> float:
@@ -14,6 +12,7 @@ def parse_coordinates(coord: Union[str, float, int]) -> float:
 
 def calculate_distance(loc1: Tuple[Union[str, float], Union[str, float]],
                        loc2: Tuple[Union[str, float], Union[str, float]]) -> float:
+    """Эталонный расчёт расстояния; в боте используется geo, сверка — benchmarks/geo.py"""
     try:
         lat1 = parse_coordinates(loc1[0])
         lon1 = parse_coordinates(loc1[1])